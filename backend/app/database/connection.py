@@ -24,6 +24,12 @@ settings_collection = db1["system_settings"]
 announcements_collection = db1["announcements"]
 notifications_collection = db["notifications"]
 read_receipts_collection = db["read_receipts"]
+llm_cache_collection = db["llm_cache"]
+rate_limits_collection = db["rate_limits"]
+ai_call_logs_collection = db["ai_call_logs"]
+jobs_collection = db["jobs"]
+transcripts_collection = db["transcripts"]
+transcript_cache_collection = db["transcript_cache"]
 
 
 
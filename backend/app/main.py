@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from app.routes import student,courses,admin,ai
+from app.services.job_worker import WorkerThread, EMBEDDED_WORKER
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -37,6 +38,20 @@ def root():
    return {"message": "Backend is running"}
 
 
+# The embedded worker (EMBEDDED_WORKER) gets its own thread and event loop, so analysis jobs never run on the request loop
+@app.on_event("startup")
+def start_embedded_worker():
+   if EMBEDDED_WORKER:
+      app.state.worker = WorkerThread()
+      app.state.worker.start()
+
+
+@app.on_event("shutdown")
+def stop_embedded_worker():
+   if EMBEDDED_WORKER:
+      app.state.worker.stop()
+
+
 app.include_router(student.router)
 app.include_router(admin.router)
 app.include_router(courses.router)
@@ -7,7 +7,7 @@ from app.schemas.auth import ForgotPasswordRequest, ResetPasswordRequest
 from app.services.email_service import send_reset_email
 import secrets
 from datetime import datetime, timedelta
-from app.services.ai_service import generate_confirmation_letter
+from app.services.ai_service import generate_confirmation_letter_async
 from app.core.dependencies import get_current_user
 import re
 
@@ -479,6 +479,7 @@ async def get_evaluation_report(response_id: str, current_user: dict = Depends(g
         "aiVerdict": ai_eval.get("aiVerdict", "No data"),
         "skillGap": ai_eval.get("skillGaps", []),
         "detailedSkillGap": ai_eval.get("detailedSkillGap", []),
+        "failedEvaluations": ai_eval.get("failedEvaluations", []),
         "videoAnswers": response.get("videoAnswers", []),
         "status": admission.get("status", "Pending"),
         "decisionNotes": admission.get("decisionNotes", ""),
@@ -530,7 +531,7 @@ async def submit_decision(response_id: str, decision_data: dict, current_user: d
         overall_avg = (mcq_score * mcq_w / 100) + (video_score_scaled * video_w / 100)
         
         try:
-            welcome_letter = generate_confirmation_letter(student_name, course_title, round(overall_avg, 1), settings)
+            welcome_letter = await generate_confirmation_letter_async(student_name, course_title, round(overall_avg, 1), settings)
         except Exception as e:
             print(f"Failed to generate confirmation letter: {e}")
 
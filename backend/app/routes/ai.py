@@ -3,11 +3,16 @@ from bson import ObjectId
 from datetime import datetime
 from app.database.connection import courses_collection, mcq_collection, video_questions_collection, settings_collection, admissions_status_collection, responses_collection, ai_evaluations_collection
 from app.services.ai_service import generate_mcqs, generate_video_questions, generate_retest_video_questions
+from app.services import ai_cache
+from app.services.ai_rate_limiter import limiter
+from app.services.ai_circuit_breaker import breaker, CircuitOpenError
+from app.services.ai_telemetry import telemetry
+from app.services import job_queue, transcript_store
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
 @router.post("/generate/mcq/{course_id}")
-def generate_mcq(course_id: str):
+def generate_mcq(course_id: str, refresh: bool = Query(False)):
     course = courses_collection.find_one({"_id": ObjectId(course_id)})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -17,7 +22,12 @@ def generate_mcq(course_id: str):
         settings = settings_collection.find_one({"type": "global_config"})
         mcq_count = settings.get("mcqCount", 10) if settings else 10
         
-        generated_mcqs = generate_mcqs(course, count=mcq_count)
+        generated_mcqs = generate_mcqs(course, count=mcq_count, refresh=refresh)
+    except CircuitOpenError:
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is temporarily unavailable, please try again shortly"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -83,7 +93,7 @@ def get_mcq(course_id: str, student_id: str = Query(None)):
     }
 
 @router.post("/generate/video-questions/{course_id}")
-def generate_video_questions_route(course_id:str):
+def generate_video_questions_route(course_id:str, refresh: bool = Query(False)):
     course = courses_collection.find_one({"_id":ObjectId(course_id)})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -93,7 +103,12 @@ def generate_video_questions_route(course_id:str):
         settings = settings_collection.find_one({"type": "global_config"})
         video_count = settings.get("videoCount", 6) if settings else 6
         
-        generated_video_questions = generate_video_questions(course, count=video_count)
+        generated_video_questions = generate_video_questions(course, count=video_count, refresh=refresh)
+    except CircuitOpenError:
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is temporarily unavailable, please try again shortly"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -211,4 +226,37 @@ def get_video_questions(course_id: str, student_id: str = Query(None)):
         "isRetest": False
     }
 
-    
\ No newline at end of file
+    
+@router.get("/cache/stats")
+def get_cache_stats():
+    return ai_cache.stats()
+
+@router.get("/rate-limit/stats")
+def get_rate_limit_stats():
+    return limiter.stats()
+
+@router.get("/breaker")
+def get_breaker_state():
+    return breaker.stats()
+
+@router.get("/metrics")
+def get_ai_metrics():
+    return {
+        "functions": telemetry.stats(),
+        "cache": ai_cache.stats(),
+        "rateLimit": limiter.stats(),
+        "breaker": breaker.stats(),
+        "transcriptCache": transcript_store.cache_stats()
+    }
+
+@router.get("/jobs/stats")
+def get_job_stats():
+    return job_queue.stats()
+
+@router.post("/jobs/{job_id}/retry")
+def retry_dead_job(job_id: str):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    if not job_queue.requeue(ObjectId(job_id)):
+        raise HTTPException(status_code=404, detail="No dead-lettered job with this ID")
+    return {"message": "Job re-queued"}
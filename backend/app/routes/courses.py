@@ -4,6 +4,7 @@ from app.schemas.courses import CourseCreate, CourseUpdate, ManualMCQ, ManualVid
 from datetime import datetime
 from bson import ObjectId
 from app.core.dependencies import get_current_user
+from app.services.ai_cache import invalidate_course
 
 router = APIRouter(prefix="/courses", tags=["Courses"])
 
@@ -138,6 +139,8 @@ def update_course(course_id: str, course_update: CourseUpdate, current_user: dic
     )
 
     if result.modified_count > 0:
+        # Generated questions and roadmaps were built from the old course details
+        invalidate_course(course_id)
         return {"message": "Course updated successfully"}
     
     return {"message": "No changes made to the course"}
@@ -227,6 +230,7 @@ def delete_course(course_id: str, current_user: dict = Depends(get_current_user)
     result = courses_collection.delete_one({"_id": course_oid})
     
     if result.deleted_count > 0:
+        invalidate_course(course_id)
         return {"message": "Course and all associated questions deleted successfully"}
     
     raise HTTPException(status_code=400, detail="Failed to delete course")
@@ -1,17 +1,23 @@
-from fastapi import APIRouter, HTTPException, status, File, UploadFile, Form, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, status, File, UploadFile, Form, BackgroundTasks, Depends, Request
 from fastapi.responses import JSONResponse
-from app.schemas.student import StudentCreate, StudentLogin, StudentProfile, StudentProfileUpdate, TestResult, StudentResponse, AIEvaluation, AdmissionsStatus, BridgeCurriculum
-from app.database.connection import db, students_collection, courses_collection, video_questions_collection, responses_collection, ai_evaluations_collection, admissions_status_collection, bridge_curriculum_collection, settings_collection, announcements_collection
+from app.schemas.student import StudentCreate, StudentLogin, StudentProfile, StudentProfileUpdate, TestResult, StudentResponse, AIEvaluation, AdmissionsStatus, BridgeCurriculum, VideoUploadParamsRequest, VideoUploadCompleteRequest
+from app.database.connection import db, students_collection, courses_collection, responses_collection, ai_evaluations_collection, admissions_status_collection, bridge_curriculum_collection, settings_collection, announcements_collection
 from app.core.security import hash_password, verify_password, create_access_token
 from app.schemas.auth import ForgotPasswordRequest, ResetPasswordRequest
 from app.services.email_service import send_reset_email
-from app.services.ai_service import analyze_test_results, evaluate_video_answer, discover_skill_gaps, generate_overall_video_evaluation, generate_bridge_path_b_content
-from app.services.cloudinary_service import upload_video
-from app.services.transcription_service import transcribe_videos
+from app.services.ai_service import analyze_test_results_async, generate_bridge_path_b_content_async
+from app.services.cloudinary_service import (
+    upload_video, video_folder, signed_upload_params, verify_upload_result, verify_upload_notification, video_delivery_url,
+    VIDEO_UPLOAD_CHUNK_SIZE, SIGNED_UPLOAD_TTL_S
+)
+from app.services.transcription_service import spool_video
+from app.services.transcript_store import hash_video
+from app.services.job_worker import enqueue_transcription, EMBEDDED_WORKER
+import json
 import secrets
 import re
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 from typing import List
 from pydantic import BaseModel
@@ -19,6 +25,9 @@ from app.core.dependencies import get_current_user
 
 router = APIRouter(prefix="/student", tags=["Student"])
 
+# Upper bound on upload chunks one submission holds in memory at once; further files wait their turn
+VIDEO_UPLOAD_MEMORY_CEILING = int(os.getenv("VIDEO_UPLOAD_MEMORY_CEILING", 48 * 1024 * 1024))
+
 @router.post("/register")
 def register_student(student: StudentCreate):
     student_dict = student.model_dump()
@@ -220,7 +229,7 @@ async def submit_test(result: TestResult):
     analysis_content = None
     analysis = None
     if result.score < passing_score:
-        analysis_content = analyze_test_results(result.answers, course_title)
+        analysis_content = await analyze_test_results_async(result.answers, course_title)
         ai_eval_data = {
             "responseId": response_id,
             "studentId": student_id,
@@ -350,7 +359,6 @@ async def check_test_status(student_id: str, course_id: str):
         
 @router.post("/submit-video-test")
 async def submit_video_test(
-    background_tasks: BackgroundTasks,
     studentId: str = Form(...),
     courseId: str = Form(...),
     courseTitle: str = Form(...),
@@ -362,17 +370,16 @@ async def submit_video_test(
         raise HTTPException(status_code=400, detail=f"'{courseId}' is not a valid course ID")
         
     try:
-        # Sanitize course title for folder name
-        safe_course_title = re.sub(r'[^a-zA-Z0-9_-]', '_', courseTitle)
-        folder_path = f"student_videos/{safe_course_title}/student_{studentId}"
+        folder_path = video_folder(courseTitle, studentId)
         
+        # Uploads are already spooled to disk by Starlette; only chunks are read into memory below
         file_data = []
         for file in files:
-            content = await file.read()
-            if len(content) > 0:
+            if file.file.seek(0, os.SEEK_END) > 0:
+                file.file.seek(0)
                 filename = file.filename or "unknown_file.mp4"
                 public_id = re.sub(r'[^a-zA-Z0-9_-]', '_', filename.split('.')[0])
-                file_data.append((content, public_id, filename))
+                file_data.append((file.file, public_id, filename))
 
         if not file_data:
             raise HTTPException(status_code=400, detail="No valid video files uploaded.")
@@ -381,208 +388,206 @@ async def submit_video_test(
         from concurrent.futures import ThreadPoolExecutor
         
         def upload_worker(data):
-            content, pid, fname = data
+            video, pid, fname = data
+            spool = None
             try:
-                cloudinary_res = upload_video(content, folder_path, pid)
+                # Lets transcription find an identical earlier video without downloading it
+                content_hash = hash_video(video)
+                # Keep a local copy so the worker in this process need not download it again
+                if EMBEDDED_WORKER:
+                    spool = spool_video(video, studentId, pid, fname)
+                # Last: upload_large closes the file
+                cloudinary_res = upload_video(video, folder_path, pid)
                 if cloudinary_res:
-                    return {"question": pid, "url": cloudinary_res.get("secure_url")}
+                    return {
+                        "question": pid,
+                        "url": cloudinary_res.get("secure_url"),
+                        "contentHash": content_hash,
+                        "spool": spool
+                    }
             except:
-                return None
+                pass
+            if spool and os.path.exists(spool):
+                os.remove(spool)
             return None
 
+        # A worker holds at most two upload chunks (the one being sent and the next one being read),
+        # so the worker count enforces the memory ceiling
+        upload_workers = max(1, VIDEO_UPLOAD_MEMORY_CEILING // (2 * VIDEO_UPLOAD_CHUNK_SIZE))
         loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
+        with ThreadPoolExecutor(max_workers=upload_workers) as executor:
             upload_results = await asyncio.gather(*[
                 loop.run_in_executor(executor, upload_worker, data) for data in file_data
             ])
 
         video_urls = [res for res in upload_results if res and "url" in res]
+        spooled = [(res["question"], res.pop("spool")) for res in video_urls]
+        local_videos = {question: path for question, path in spooled if path}
         if not video_urls:
             raise HTTPException(status_code=500, detail="Failed to upload videos.")
 
-        # --- Normalized Logic ---
-        responses_collection.update_one(
-            {"studentId": ObjectId(studentId), "courseId": ObjectId(courseId)},
-            {"$set": {
-                "videoUrls": video_urls,
-                "videoSubmittedAt": datetime.utcnow()
-            }}
-        )
-
-        # Ensure status is updated from READY_FOR_RETEST to Pending
-        response_doc = responses_collection.find_one({"studentId": ObjectId(studentId), "courseId": ObjectId(courseId)})
-        if response_doc:
-            admissions_status_collection.update_one(
-                {"responseId": response_doc["_id"]},
-                {"$set": {"status": "Pending"}}
-            )
-
-        background_tasks.add_task(transcribe_videos, studentId, courseId, video_urls)
+        record_video_submission(studentId, courseId, video_urls, local_videos)
 
         return {"message": "Video test submitted successfully.", "videoUrls": video_urls}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def process_video_test_analysis(student_id: str, course_id: str):
-    try:
-        # 1. Fetch the latest student response
-        response = responses_collection.find_one({
-            "studentId": ObjectId(student_id),
-            "courseId": ObjectId(course_id)
-        }, sort=[("submittedAt", -1)])
-        
-        if not response or "videoAnswers" not in response:
-            print("No video answers found for analysis")
-            return
-
-        # 2. Identify which questions were used
-        course = courses_collection.find_one({"_id": ObjectId(course_id)})
-        
-        # Check if it was a retest with dynamic questions
-        admission = admissions_status_collection.find_one({"responseId": response["_id"]})
-        if admission and "retestQuestions" in admission:
-            active_questions = admission["retestQuestions"]
-            print(f"Using dynamic retest questions for student {student_id}")
-        else:
-            video_questions_doc = video_questions_collection.find_one({"courseId": ObjectId(course_id)})
-            active_questions = video_questions_doc.get("videoQuestions", []) if video_questions_doc else []
-            print(f"Using standard course questions for student {student_id}")
-        
-        if not course:
-            print("Course not found")
-            return
-        
-        # 3. Analyze each answer
-        total_score = 0
-        count = 0
-        updated_answers = []
-        
-        for q_answer in response.get("videoAnswers", []):
-            question_id = q_answer.get("questionId")
-            transcript = q_answer.get("transcript")
-            
-            # Map transcript to the actual question data
-            try:
-                # Find the numeric index from IDs like "Q1", "Video_1", "question_1"
-                import re
-                match = re.search(r'\d+', question_id)
-                idx = int(match.group()) - 1 if match else -1
-                
-                if 0 <= idx < len(active_questions):
-                    question_obj = active_questions[idx]
-                    question_data = {
-                        "question": question_obj.get("question"), 
-                        "relatedSkill": question_obj.get("relatedSkill", "General"),
-                        "expectedConcepts": question_obj.get("expectedConcepts", [])
-                    }
-                    related_skill = question_obj.get("relatedSkill", "General")
-                else:
-                    question_data = {"question": question_id, "relatedSkill": "General"}
-                    related_skill = "General"
-            except Exception as e:
-                print(f"Index mapping error for {question_id}: {e}")
-                question_data = {"question": question_id, "relatedSkill": "General"}
-                related_skill = "General"
-
-            # Call AI Evaluation
-            analysis = evaluate_video_answer(question_data, transcript, course)
-            
-            q_answer["analysis"] = analysis
-            q_answer["relatedSkill"] = related_skill
-            updated_answers.append(q_answer)
-            
-            # Update scoring
-            score = analysis.get("technicalScore", 0)
-            total_score += score
-            count += 1
-
-        # Fetch settings for weightages and passing score
-        settings = settings_collection.find_one({"type": "global_config"})
-        skill_threshold = settings.get("passingScore", 70) / 10 if settings else 7.0
-        
-        mcq_answers = response.get("mcqAnswers", [])
-        detailed_skill_gaps = discover_skill_gaps(mcq_answers, updated_answers, course, threshold=skill_threshold)
-        
-        # Flatten the detailed categorical gaps 
-        unique_weak_skills = []
-        for cat in detailed_skill_gaps:
-            for skill in cat.get("skills", []):
-                if skill.get("isGap", False):
-                    unique_weak_skills.append(skill.get("skillName"))
-        unique_weak_skills = list(set([s for s in unique_weak_skills if s != "General"]))
-
-        
-        # 4.1 Overall Performance Signal (AI-based)
-        overall_eval = generate_overall_video_evaluation(updated_answers, course)
-        avg_score = round(total_score / count, 2) if count > 0 else 0
+def record_video_submission(student_id, course_id, video_urls, local_videos=None):
+    """
+    Stores the submitted video URLs, puts the admission back to Pending and
+    queues transcription.
+    """
+    # --- Normalized Logic ---
+    responses_collection.update_one(
+        {"studentId": ObjectId(student_id), "courseId": ObjectId(course_id)},
+        {"$set": {
+            "videoUrls": video_urls,
+            "videoSubmittedAt": datetime.utcnow()
+        }}
+    )
 
-        # 5. Update DB (Normalized)
-        response_id = response["_id"]
-        
-        ai_eval_data = {
-            "responseId": response_id,
-            "studentId": ObjectId(student_id),
-            "courseId": ObjectId(course_id),
-            "scores": {
-                "mcq": response.get("mcqScore", 0),
-                "overallVideo": avg_score
-            },
-            "executiveSummary": overall_eval.get("executiveSummary"),
-            "skillGaps": unique_weak_skills,
-            "vibeCheck": overall_eval.get("vibeCheck"),
-            "aiVerdict": overall_eval.get("aiVerdict"),
-            "eligibilitySignal": overall_eval.get("overallEligibilitySignal"),
-            "overallReasoning": overall_eval.get("overallReasoning"),
-            "competencyGapReport": overall_eval.get("competencyGap"),
-            "detailedSkillGap": detailed_skill_gaps,
-            "evaluatedAt": datetime.utcnow()
-        }
-        
-        ai_evaluations_collection.update_one(
-            {"responseId": response_id},
-            {"$set": ai_eval_data},
-            upsert=True
-        )
-        
-        responses_collection.update_one(
-            {"_id": response_id},
-            {"$set": {"videoAnswers": updated_answers}}
+    # Ensure status is updated from READY_FOR_RETEST to Pending
+    response_doc = responses_collection.find_one({"studentId": ObjectId(student_id), "courseId": ObjectId(course_id)})
+    if response_doc:
+        admissions_status_collection.update_one(
+            {"responseId": response_doc["_id"]},
+            {"$set": {"status": "Pending"}}
         )
-        
-        # 6. Notify Admin
-        notify_admin_of_evaluation(student_id, course_id, avg_score, unique_weak_skills)
-        
-        print(f"AI analysis completed for student {student_id} in course {course_id}")
-        
-    except Exception as e:
-        print(f"Error in process_video_test_analysis: {str(e)}")
 
-def notify_admin_of_evaluation(student_id, course_id, score, skill_gap):
-    try:
-        student = students_collection.find_one({"_id": ObjectId(student_id)})
-        course = courses_collection.find_one({"_id": ObjectId(course_id)})
-        
-        if not student or not course:
-            return
+    # Durable job: survives restarts and may run on a separate worker machine
+    enqueue_transcription(student_id, course_id, video_urls, local_videos)
+
+@router.post("/video-upload-params")
+async def get_video_upload_params(data: VideoUploadParamsRequest):
+    """
+    Signed parameters for uploading each answer video straight to storage,
+    bypassing this API. The client then calls /submit-video-test/complete
+    with the upload responses (or storage calls /video-upload-notification).
+    """
+    if not ObjectId.is_valid(data.studentId):
+        raise HTTPException(status_code=400, detail=f"'{data.studentId}' is not a valid student ID")
+    if not ObjectId.is_valid(data.courseId):
+        raise HTTPException(status_code=400, detail=f"'{data.courseId}' is not a valid course ID")
+    question_ids = list(dict.fromkeys(re.sub(r'[^a-zA-Z0-9_-]', '_', question_id) for question_id in data.questionIds))
+    if not question_ids:
+        raise HTTPException(status_code=400, detail="No questions to upload.")
+
+    folder_path = video_folder(data.courseTitle, data.studentId)
+    result = responses_collection.update_one(
+        {"studentId": ObjectId(data.studentId), "courseId": ObjectId(data.courseId)},
+        {"$set": {"videoUploadSession": {
+            "folder": folder_path,
+            "questions": question_ids,
+            "uploads": {},
+            "issuedAt": datetime.utcnow()
+        }}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Test response not found")
 
-        notification = {
-            "type": "video_test_evaluation",
-            "studentId": ObjectId(student_id),
-            "studentName": f"{student.get('firstName')} {student.get('lastName')}",
-            "courseId": ObjectId(course_id),
-            "courseTitle": course.get('title'),
-            "score": round(score, 2),
-            "skillGap": skill_gap,
-            "status": "unread",
-            "isRead": False,
-            "timestamp": datetime.utcnow()
-        }
-        
-        # Insert into a notifications collection in the main db
-        db.notifications.insert_one(notification)
-        print("Admin notification created")
-    except Exception as e:
-        print(f"Failed to notify admin: {str(e)}")
+    return {
+        "uploads": [
+            {"questionId": question_id, **signed_upload_params(folder_path, question_id)}
+            for question_id in question_ids
+        ],
+        "expiresIn": SIGNED_UPLOAD_TTL_S
+    }
+
+def _record_direct_upload(response, public_id, version, format=None):
+    """
+    Adds one finished (already verified) upload to the response's upload
+    session. Returns False if the upload does not belong to that session or
+    was made before its upload parameters were issued (a replayed response
+    from an earlier attempt).
+    """
+    session = response.get("videoUploadSession") or {}
+    folder, _, question_id = public_id.rpartition("/")
+    if folder != session.get("folder") or question_id not in session.get("questions", []):
+        return False
+    issued_at = session.get("issuedAt")
+    if issued_at and int(version) < int(issued_at.replace(tzinfo=timezone.utc).timestamp()):
+        return False
+    responses_collection.update_one(
+        {"_id": response["_id"]},
+        {"$set": {f"videoUploadSession.uploads.{question_id}": video_delivery_url(public_id, version, format)}}
+    )
+    return True
+
+def _complete_upload_session(response_id, require_all):
+    """
+    Records the submission once per upload session, whichever of the client
+    and the storage notification gets here first. With `require_all`, waits
+    until every question has an upload. Returns the video URLs, or None if
+    the session is not ready or was already completed.
+    """
+    response = responses_collection.find_one({"_id": response_id})
+    session = (response or {}).get("videoUploadSession") or {}
+    uploads = session.get("uploads", {})
+    video_urls = [{"question": question_id, "url": uploads[question_id]} for question_id in session.get("questions", []) if question_id in uploads]
+    if not video_urls or (require_all and len(video_urls) < len(session["questions"])):
+        return None
+
+    claimed = responses_collection.update_one(
+        {"_id": response_id, "videoUploadSession.completedAt": {"$exists": False}},
+        {"$set": {"videoUploadSession.completedAt": datetime.utcnow()}}
+    )
+    if claimed.modified_count == 0:
+        return None
+    # No local copy here; transcription downloads each video from storage
+    record_video_submission(str(response["studentId"]), str(response["courseId"]), video_urls)
+    return video_urls
+
+@router.post("/submit-video-test/complete")
+async def complete_video_test_upload(data: VideoUploadCompleteRequest):
+    """
+    Finishes a direct-to-storage submission: `uploads` are the storage
+    responses for the videos the client uploaded with /video-upload-params.
+    """
+    if not ObjectId.is_valid(data.studentId):
+        raise HTTPException(status_code=400, detail=f"'{data.studentId}' is not a valid student ID")
+    if not ObjectId.is_valid(data.courseId):
+        raise HTTPException(status_code=400, detail=f"'{data.courseId}' is not a valid course ID")
+
+    response = responses_collection.find_one({"studentId": ObjectId(data.studentId), "courseId": ObjectId(data.courseId)})
+    if not response or not response.get("videoUploadSession"):
+        raise HTTPException(status_code=400, detail="Request upload parameters before completing an upload.")
+
+    for upload in data.uploads:
+        if not verify_upload_result(upload.public_id, upload.version, upload.signature):
+            raise HTTPException(status_code=400, detail=f"Upload '{upload.public_id}' could not be verified")
+        if not _record_direct_upload(response, upload.public_id, upload.version, upload.format):
+            raise HTTPException(status_code=400, detail=f"Upload '{upload.public_id}' does not belong to this test attempt")
+
+    video_urls = _complete_upload_session(response["_id"], require_all=False)
+    if video_urls is None:
+        if response["videoUploadSession"].get("completedAt"):
+            return {"message": "Video test already submitted."}
+        raise HTTPException(status_code=400, detail="No valid video files uploaded.")
+    return {"message": "Video test submitted successfully.", "videoUrls": video_urls}
+
+@router.post("/video-upload-notification")
+async def video_upload_notification(request: Request):
+    """
+    Storage webhook (notification_url of the signed uploads). Records each
+    upload and submits the test once every question has arrived.
+    """
+    body = (await request.body()).decode()
+    if not verify_upload_notification(body, request.headers.get("X-Cld-Timestamp"), request.headers.get("X-Cld-Signature")):
+        raise HTTPException(status_code=401, detail="Invalid notification signature")
+
+    notification = json.loads(body)
+    public_id = notification.get("public_id")
+    if notification.get("notification_type", "upload") != "upload" or not public_id:
+        return {"status": "ignored"}
+
+    folder, _, question_id = public_id.rpartition("/")
+    response = responses_collection.find_one(
+        {"videoUploadSession.folder": folder, "videoUploadSession.questions": question_id},
+        sort=[("submittedAt", -1)]
+    )
+    if not response or not _record_direct_upload(response, public_id, notification.get("version", 0), notification.get("format")):
+        return {"status": "ignored"}
+    return {"status": "submitted" if _complete_upload_session(response["_id"], require_all=True) else "recorded"}
 
 @router.get("/notifications/{student_id}")
 async def get_student_notifications(student_id: str, current_user: dict = Depends(get_current_user)):
@@ -763,7 +768,7 @@ class BridgePathRequest(BaseModel):
 @router.post("/bridge-path-b")
 async def get_bridge_path_b(request: BridgePathRequest):
     try:
-        content = generate_bridge_path_b_content(request.skillGap)
+        content = await generate_bridge_path_b_content_async(request.skillGap)
         return content
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -788,7 +793,7 @@ async def start_bridge_course(student_id: str, course_id: str):
     skill_gaps = ai_eval.get("skillGaps", []) if ai_eval else []
     
     # Generate content
-    checklist_data = generate_bridge_path_b_content(skill_gaps)
+    checklist_data = await generate_bridge_path_b_content_async(skill_gaps)
     
     # Store in bridge_curriculum_collection
     bridge_curriculum_collection.update_one(
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 class AdminBase(BaseModel):
     firstName: str
@@ -39,6 +39,8 @@ class SystemSettings(BaseModel):
     mcqWeightage: int = 40
     videoWeightage: int = 60
     passingScore: int = 50
+    evaluationMode: Literal["per_answer", "batched", "fused"] = "per_answer"
+    aiSkillGapReasoning: bool = False  # Let Gemini phrase the locally computed skill gap reasoning
     instituteName: str
     instituteAddress: str
     instituteWebsite: str
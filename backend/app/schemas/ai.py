@@ -0,0 +1,75 @@
+from pydantic import BaseModel
+from typing import List
+
+# Response schemas passed to Gemini as response_schema and validated on receipt.
+# Fields intentionally have no defaults: Gemini must return every key.
+
+class MCQQuestion(BaseModel):
+    question: str
+    options: List[str]
+    answer: str
+    relatedSkill: str
+
+class VideoQuestion(BaseModel):
+    question: str
+    relatedSkill: str
+    expectedConcepts: List[str]
+
+class TestAnalysis(BaseModel):
+    weak_skills: List[str]
+    recommendations: List[str]
+
+class VideoAnswerEvaluation(BaseModel):
+    skill: str
+    conceptCoverageScore: float
+    technicalScore: float
+    feedback: str
+    improvementAreas: List[str]
+    clarityScore: float
+    overallScore: float
+    skillLevelAssessment: str
+    strengths: List[str]
+    weakAreas: List[str]
+    improvementSuggestions: List[str]
+
+class BatchVideoAnswerEvaluation(VideoAnswerEvaluation):
+    answerIndex: int
+
+class SkillGapReasoning(BaseModel):
+    skillName: str
+    reasoning: str
+
+class OverallVideoEvaluation(BaseModel):
+    overallEligibilitySignal: str
+    executiveSummary: str
+    overallReasoning: str
+    competencyGap: str
+    vibeCheck: str
+    aiVerdict: str
+
+class BridgeChecklistItem(BaseModel):
+    concept: str
+    difficulty: str
+    description: str
+    subtopics: List[str]
+
+class BridgeReference(BaseModel):
+    title: str
+    url: str
+
+class BridgePathContent(BaseModel):
+    checklist: List[BridgeChecklistItem]
+    references: List[BridgeReference]
+
+class ConfirmationLetter(BaseModel):
+    letter: str
+
+class VideoTranscription(BaseModel):
+    transcript: str
+    facialExpression: str
+    confidenceScore: float
+
+class VideoAnswerAssessment(VideoAnswerEvaluation):
+    transcript: str
+    facialExpression: str
+    confidenceScore: float
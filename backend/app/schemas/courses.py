@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Literal
 
 class CourseBase(BaseModel):
     title: str
@@ -9,6 +9,7 @@ class CourseBase(BaseModel):
     duration: str
     skills_required: List[str]
     status: str = "Draft"
+    evaluationMode: Optional[Literal["per_answer", "batched", "fused"]] = None  # Overrides the global evaluationMode setting
 
 class CourseCreate(CourseBase):
     pass
@@ -27,6 +28,7 @@ class CourseUpdate(BaseModel):
     duration: Optional[str] = None
     skills_required: Optional[List[str]] = None
     status: Optional[str] = None
+    evaluationMode: Optional[Literal["per_answer", "batched", "fused"]] = None
 
 class ManualMCQ(BaseModel):
     question: str
@@ -89,3 +89,21 @@ class BridgeCurriculum(BaseModel):
     roadmap: List[dict]
     checklist: List[dict]
     isActive: bool = True
+
+class VideoUploadParamsRequest(BaseModel):
+    studentId: str
+    courseId: str
+    courseTitle: str
+    questionIds: List[str]
+
+class CompletedVideoUpload(BaseModel):
+    # Fields as returned by the storage upload response (its URLs are ignored)
+    public_id: str
+    version: int
+    signature: str
+    format: Optional[str] = None
+
+class VideoUploadCompleteRequest(BaseModel):
+    studentId: str
+    courseId: str
+    uploads: List[CompletedVideoUpload]
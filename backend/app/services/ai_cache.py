@@ -0,0 +1,212 @@
+import os
+import copy
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.database.connection import llm_cache_collection
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 256))
+
+# Seconds each cached function's responses stay valid
+DEFAULT_TTL = 24 * 3600
+FUNCTION_TTLS = {
+    "generate_mcqs": 7 * 24 * 3600,
+    "generate_video_questions": 7 * 24 * 3600,
+    "generate_retest_video_questions": 3 * 24 * 3600,
+    "generate_bridge_path_b_content": 30 * 24 * 3600,
+    "analyze_test_results": 24 * 3600,
+}
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+_stats = {}
+_index_ready = False
+# Persistent writes go through one background thread, like telemetry
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-cache")
+_MISS = object()
+
+
+def _normalize(value):
+    """
+    Collapses whitespace in strings so cosmetic differences map to the same key.
+    """
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_key(name, model, inputs):
+    payload = json.dumps(
+        {"fn": name, "model": model, "inputs": _normalize(inputs)},
+        sort_keys=True, default=str, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count(name, field):
+    with _lock:
+        counters = _stats.setdefault(name, {"memoryHits": 0, "mongoHits": 0, "misses": 0, "stores": 0})
+        counters[field] += 1
+
+
+def _ensure_index():
+    global _index_ready
+    if _index_ready:
+        return
+    try:
+        llm_cache_collection.create_index("expiresAt", expireAfterSeconds=0)
+        llm_cache_collection.create_index("tags")
+    except Exception as e:
+        print(f"Warning: Failed to create LLM cache indexes: {e}")
+    _index_ready = True
+
+
+def _remember(key, entry):
+    with _lock:
+        _lru[key] = entry
+        _lru.move_to_end(key)
+        while len(_lru) > LLM_CACHE_MAX_ENTRIES:
+            _lru.popitem(last=False)
+
+
+def _memory_lookup(name, key):
+    with _lock:
+        entry = _lru.get(key)
+        if entry and entry["expiresAt"] > datetime.utcnow():
+            _lru.move_to_end(key)
+        else:
+            entry = None
+    if not entry:
+        return _MISS
+    _count(name, "memoryHits")
+    return entry["value"]
+
+
+def _mongo_lookup(name, key):
+    try:
+        doc = llm_cache_collection.find_one({"_id": key, "expiresAt": {"$gt": datetime.utcnow()}})
+    except Exception as e:
+        print(f"Warning: LLM cache lookup failed: {e}")
+        doc = None
+    if not doc:
+        return _MISS
+    _remember(key, {"value": doc["value"], "expiresAt": doc["expiresAt"], "tags": doc.get("tags", [])})
+    _count(name, "mongoHits")
+    return doc["value"]
+
+
+def _result(name, value):
+    if value is _MISS:
+        _count(name, "misses")
+        return False, None
+    return True, copy.deepcopy(value)
+
+
+def get(request):
+    """
+    Looks up a cached result for an AIRequest.
+    :return: (hit, value) — value is a private copy safe to mutate.
+    """
+    if request.cache_inputs is None:
+        return False, None
+    key = make_key(request.name, request.model, request.cache_inputs)
+    value = _MISS
+    if not request.cache_refresh:
+        value = _memory_lookup(request.name, key)
+        if value is _MISS:
+            value = _mongo_lookup(request.name, key)
+    return _result(request.name, value)
+
+
+async def aget(request):
+    """
+    Like get, but the Mongo lookup runs in a worker thread so it does not
+    block the event loop.
+    """
+    if request.cache_inputs is None:
+        return False, None
+    key = make_key(request.name, request.model, request.cache_inputs)
+    value = _MISS
+    if not request.cache_refresh:
+        value = _memory_lookup(request.name, key)
+        if value is _MISS:
+            value = await asyncio.to_thread(_mongo_lookup, request.name, key)
+    return _result(request.name, value)
+
+
+def _persist(key, doc):
+    _ensure_index()
+    try:
+        llm_cache_collection.update_one({"_id": key}, {"$set": doc}, upsert=True)
+    except Exception as e:
+        print(f"Warning: Failed to persist LLM cache entry: {e}")
+
+
+def put(request, value):
+    """
+    Stores a successfully parsed result for an AIRequest. The in-memory entry
+    is immediate; the Mongo write happens on a background writer thread.
+    """
+    if request.cache_inputs is None:
+        return
+    key = make_key(request.name, request.model, request.cache_inputs)
+    ttl = FUNCTION_TTLS.get(request.name, DEFAULT_TTL)
+    now = datetime.utcnow()
+    entry = {
+        "value": copy.deepcopy(value),
+        "expiresAt": now + timedelta(seconds=ttl),
+        "tags": list(request.cache_tags or [])
+    }
+    _remember(key, entry)
+    _count(request.name, "stores")
+    _writer.submit(_persist, key, {
+        "function": request.name,
+        "model": request.model,
+        "value": entry["value"],
+        "tags": entry["tags"],
+        "createdAt": now,
+        "expiresAt": entry["expiresAt"]
+    })
+
+
+def invalidate_tag(tag):
+    """
+    Drops every cached response tagged with `tag` (e.g. "course:<id>").
+    """
+    with _lock:
+        stale = [k for k, entry in _lru.items() if tag in entry["tags"]]
+        for k in stale:
+            del _lru[k]
+    try:
+        result = llm_cache_collection.delete_many({"tags": tag})
+        removed = result.deleted_count
+    except Exception as e:
+        print(f"Warning: Failed to invalidate LLM cache for {tag}: {e}")
+        removed = 0
+    print(f"LLM cache invalidated for {tag}: {len(stale)} in memory, {removed} persisted")
+
+
+def invalidate_course(course_id):
+    invalidate_tag(f"course:{course_id}")
+
+
+def stats():
+    with _lock:
+        functions = {}
+        for name, counters in _stats.items():
+            hits = counters["memoryHits"] + counters["mongoHits"]
+            lookups = hits + counters["misses"]
+            functions[name] = {**counters, "hitRatio": round(hits / lookups, 3) if lookups else 0}
+        return {
+            "memoryEntries": len(_lru),
+            "maxMemoryEntries": LLM_CACHE_MAX_ENTRIES,
+            "functions": functions
+        }
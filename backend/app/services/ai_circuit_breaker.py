@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+import httpx
+from google.genai import errors
+from app.services.ai_rate_limiter import is_throttling_error
+
+# Rolling window the error rate is computed over
+AI_BREAKER_WINDOW_S = float(os.getenv("AI_BREAKER_WINDOW_S", 60))
+# Minimum calls in the window before the breaker may open
+AI_BREAKER_MIN_CALLS = int(os.getenv("AI_BREAKER_MIN_CALLS", 8))
+AI_BREAKER_ERROR_RATE = float(os.getenv("AI_BREAKER_ERROR_RATE", 0.5))
+# How long the breaker stays open before a probe call is allowed
+AI_BREAKER_COOLDOWN_S = float(os.getenv("AI_BREAKER_COOLDOWN_S", 30))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Gemini while the breaker is open.
+    """
+
+
+def is_outage_error(error):
+    """
+    Errors that say Gemini is unhealthy (as opposed to a bad request or bad output).
+    """
+    return (
+        isinstance(error, (errors.ServerError, httpx.TransportError, TimeoutError, asyncio.TimeoutError))
+        or is_throttling_error(error)
+    )
+
+
+class CircuitBreaker:
+    """
+    Fails Gemini calls fast while the recent error rate is too high.
+
+    closed → open when at least AI_BREAKER_MIN_CALLS outcomes in the window have
+    an outage-error rate of AI_BREAKER_ERROR_RATE or more. After
+    AI_BREAKER_COOLDOWN_S one probe call is let through (half open); success
+    closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.outcomes = deque()
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _trim(self, now):
+        while self.outcomes and now - self.outcomes[0][0] > AI_BREAKER_WINDOW_S:
+            self.outcomes.popleft()
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError unless a call may go out now. Returns True when
+        the call is the half-open probe.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN and time.monotonic() - self.opened_at >= AI_BREAKER_COOLDOWN_S:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.rejected += 1
+            raise CircuitOpenError("Gemini circuit breaker is open; failing fast")
+
+    def check(self):
+        """
+        Raises CircuitOpenError while open, without claiming the probe. Lets
+        callers skip expensive preparation (downloads, uploads) up front.
+        """
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at < AI_BREAKER_COOLDOWN_S:
+                self.rejected += 1
+                raise CircuitOpenError("Gemini circuit breaker is open; failing fast")
+
+    def record(self, error=None, probe=False):
+        """
+        Records a call outcome. Errors that are not outages count as successes
+        for breaker purposes (Gemini answered).
+        """
+        failed = error is not None and is_outage_error(error)
+        with self.lock:
+            now = time.monotonic()
+            if probe:
+                self.probe_in_flight = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                    print("[ai] Circuit breaker closed")
+            elif self.state == CLOSED:
+                self.outcomes.append((now, failed))
+                self._trim(now)
+                failures = sum(1 for _, f in self.outcomes if f)
+                if len(self.outcomes) >= AI_BREAKER_MIN_CALLS and failures / len(self.outcomes) >= AI_BREAKER_ERROR_RATE:
+                    self._open(now)
+
+    def abandon_probe(self):
+        """
+        Lets another call act as the probe when this one was cancelled.
+        """
+        with self.lock:
+            self.probe_in_flight = False
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        print(f"[ai] Circuit breaker opened; failing fast for {AI_BREAKER_COOLDOWN_S}s")
+
+    def retry_after(self):
+        """
+        Seconds until work rejected by the breaker is worth retrying: 0 when
+        closed, a full cooldown while a probe is in flight.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return 0
+            if self.state == HALF_OPEN:
+                return AI_BREAKER_COOLDOWN_S
+            return max(0.0, AI_BREAKER_COOLDOWN_S - (time.monotonic() - self.opened_at))
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            self._trim(now)
+            failures = sum(1 for _, f in self.outcomes if f)
+            return {
+                "state": self.state,
+                "windowCalls": len(self.outcomes),
+                "windowFailures": failures,
+                "errorRate": round(failures / len(self.outcomes), 3) if self.outcomes else 0,
+                "openForSeconds": round(now - self.opened_at, 1) if self.state != CLOSED and self.opened_at else 0,
+                "timesOpened": self.times_opened,
+                "rejectedCalls": self.rejected
+            }
+
+
+breaker = CircuitBreaker()
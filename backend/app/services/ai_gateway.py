@@ -0,0 +1,398 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+from google import genai
+from pydantic import TypeAdapter
+from dotenv import load_dotenv
+from app.services import ai_cache
+from app.services.prompt_encoder import estimate_contents_tokens, TOKEN_BUDGETS
+from app.services.ai_rate_limiter import limiter, is_throttling_error, INTERACTIVE, BACKGROUND
+from app.services.ai_circuit_breaker import breaker, CircuitOpenError
+from app.services.ai_telemetry import telemetry, CallRecord, OK, REPAIRED, CACHE_HIT, FALLBACK, ERROR, CIRCUIT_OPEN
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Use the count_tokens API (one extra round-trip) instead of the local estimate
+AI_EXACT_TOKEN_COUNT = os.getenv("AI_EXACT_TOKEN_COUNT", "false").lower() == "true"
+# Deadline for a single generate_content call, in seconds
+AI_CALL_TIMEOUT_S = float(os.getenv("AI_CALL_TIMEOUT_S", 60))
+# Requests marked hedge=True only hedge when this is on (each hedge is a second paid call)
+AI_HEDGING = os.getenv("AI_HEDGING", "false").lower() == "true"
+# A hedged request fires a second attempt once the first has run longer than the function's
+# observed p95; until AI_HEDGE_MIN_SAMPLES calls have been timed, after AI_HEDGE_DELAY_S
+AI_HEDGE_DELAY_S = float(os.getenv("AI_HEDGE_DELAY_S", 15))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", 20))
+# A throttled (429) call goes back through the rate limiter up to this many times before
+# it fails (and its fallback runs), waiting AI_THROTTLE_BACKOFF_S * 2^retry (with jitter) first
+AI_THROTTLE_RETRIES = int(os.getenv("AI_THROTTLE_RETRIES", 3))
+AI_THROTTLE_BACKOFF_S = float(os.getenv("AI_THROTTLE_BACKOFF_S", 2))
+
+# One process-wide client for sync callers (threadpool routes, background tasks)
+_client = None
+_client_lock = threading.Lock()
+
+# The aio transport is bound to the event loop it first runs on, so async
+# callers get one long-lived client per loop (in practice: the uvicorn loop).
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Returns the shared Gemini client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = genai.Client(api_key=GEMINI_API_KEY)
+    return _client
+
+
+def get_async_client():
+    """
+    Returns the `client.aio` surface for the currently running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _loop_clients.get(loop)
+    if client is None:
+        client = genai.Client(api_key=GEMINI_API_KEY)
+        _loop_clients[loop] = client
+    return client.aio
+
+
+def _response_text(response):
+    return response.text
+
+
+def _repair_prompt(text, error):
+    return f"""
+    The JSON below was supposed to match the required response schema but failed validation.
+
+    Validation error:
+    {error}
+
+    Invalid JSON:
+    {text}
+
+    Return ONLY the corrected JSON. Keep all existing content; only fix structure, types and missing keys.
+    """
+
+
+class AIRequest:
+    """
+    A single Gemini generate_content call plus how to interpret its result.
+
+    :param name: Function name used in logs.
+    :param contents: Prompt contents passed to generate_content.
+    :param model: Model name.
+    :param config: Optional generate_content config.
+    :param schema: Pydantic model (or list[Model]) passed to Gemini as
+                   response_schema. The response is validated against it and
+                   a single repair call is made if validation fails.
+    :param transform: Optional callable applied to the validated data.
+    :param parse: Callable turning the raw response into the return value,
+                  used only for requests without a schema.
+    :param fallback: Optional callable receiving the exception. It may return a
+                     value, or another AIRequest to run instead. Without a
+                     fallback the exception is re-raised.
+    :param cache_inputs: Inputs the prompt is built from. When set, parsed
+                         results are cached under a hash of (name, model, inputs).
+    :param cache_tags: Tags used for explicit invalidation, e.g. "course:<id>".
+    :param cache_refresh: Skip the cache lookup but still store the new result.
+    :param priority: INTERACTIVE (a user is waiting) or BACKGROUND.
+    :param timeout: Deadline in seconds for each generate_content attempt.
+    :param hedge: For short interactive calls run with arun (and AI_HEDGING on):
+                  if no answer arrives within the function's observed p95 a
+                  second attempt is fired and whichever finishes first wins.
+    """
+
+    def __init__(self, name, contents, model=GEMINI_MODEL, config=None, schema=None, transform=None,
+                 parse=None, fallback=None, cache_inputs=None, cache_tags=None, cache_refresh=False,
+                 priority=INTERACTIVE, timeout=AI_CALL_TIMEOUT_S, hedge=False):
+        self.name = name
+        self.contents = contents
+        self.model = model
+        self.config = dict(config or {})
+        if schema is not None:
+            self.config.update({"response_mime_type": "application/json", "response_schema": schema})
+        self.schema = schema
+        self.transform = transform
+        self.parse = parse or _response_text
+        self.fallback = fallback
+        self.cache_inputs = cache_inputs
+        self.cache_tags = cache_tags
+        self.cache_refresh = cache_refresh
+        self.priority = priority
+        self.timeout = timeout
+        self.hedge = hedge
+        self.prompt_tokens = None
+
+
+def _log_prompt_tokens(request, tokens, exact):
+    request.prompt_tokens = tokens
+    budget = TOKEN_BUDGETS.get(request.name)
+    over = f" — over budget of {budget}" if budget and tokens > budget else ""
+    print(f"[ai] {request.name}: {'' if exact else '~'}{tokens} prompt tokens{over}")
+
+
+def count_prompt_tokens(request):
+    """
+    Counts (or estimates) the prompt tokens of a request and logs them.
+    """
+    if AI_EXACT_TOKEN_COUNT:
+        try:
+            result = get_client().models.count_tokens(model=request.model, contents=request.contents)
+            return _log_prompt_tokens(request, result.total_tokens, True)
+        except Exception as e:
+            print(f"Warning: count_tokens failed for {request.name}: {e}")
+    _log_prompt_tokens(request, estimate_contents_tokens(request.contents), False)
+
+
+async def acount_prompt_tokens(request):
+    if AI_EXACT_TOKEN_COUNT:
+        try:
+            result = await get_async_client().models.count_tokens(model=request.model, contents=request.contents)
+            return _log_prompt_tokens(request, result.total_tokens, True)
+        except Exception as e:
+            print(f"Warning: count_tokens failed for {request.name}: {e}")
+    _log_prompt_tokens(request, estimate_contents_tokens(request.contents), False)
+
+
+def _parse(request, response):
+    """
+    Validates a structured response into plain python data. Raises ValueError
+    (pydantic's ValidationError included) when the output does not match.
+    """
+    if request.schema is None:
+        return request.parse(response)
+    adapter = TypeAdapter(request.schema)
+    data = adapter.dump_python(adapter.validate_json(response.text or ""), mode="json")
+    return request.transform(data) if request.transform else data
+
+
+def _call_config(request):
+    config = dict(request.config)
+    if request.timeout:
+        config["http_options"] = {"timeout": int(request.timeout * 1000)}
+    return config or None
+
+
+def _throttle_backoff(request, retry, error):
+    """
+    Seconds to wait before re-queuing a throttled call, or None once the
+    retries are used up (or the error is not throttling).
+    """
+    if not is_throttling_error(error) or retry >= AI_THROTTLE_RETRIES:
+        return None
+    delay = AI_THROTTLE_BACKOFF_S * 2 ** retry * random.uniform(1, 1.5)
+    print(f"[ai] {request.name}: throttled, retrying in {delay:.1f}s ({retry + 1}/{AI_THROTTLE_RETRIES})")
+    return delay
+
+
+def _generate_attempt(request, contents, call):
+    probe = breaker.before_call()
+    try:
+        queue_wait = limiter.acquire(request.priority)
+    except BaseException:
+        # Cancelled (or failed) before the call went out: let another call be the probe
+        if probe:
+            breaker.abandon_probe()
+        raise
+    call.attempt(queue_wait)
+    error = None
+    try:
+        response = get_client().models.generate_content(
+            model=request.model,
+            contents=contents,
+            config=_call_config(request)
+        )
+        call.add_usage(response)
+        return response
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        limiter.release(error)
+        breaker.record(error, probe)
+
+
+def _generate(request, contents, call):
+    retry = 0
+    while True:
+        try:
+            return _generate_attempt(request, contents, call)
+        except Exception as e:
+            delay = _throttle_backoff(request, retry, e)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        retry += 1
+
+
+async def _agenerate_attempt(request, contents, call):
+    probe = breaker.before_call()
+    try:
+        queue_wait = await limiter.acquire_async(request.priority)
+    except BaseException:
+        # Cancelled (or failed) before the call went out: let another call be the probe
+        if probe:
+            breaker.abandon_probe()
+        raise
+    call.attempt(queue_wait)
+    error = None
+    try:
+        pending = get_async_client().models.generate_content(
+            model=request.model,
+            contents=contents,
+            config=_call_config(request)
+        )
+        response = await asyncio.wait_for(pending, request.timeout) if request.timeout else await pending
+        call.add_usage(response)
+        return response
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        limiter.release(error)
+        # A hedge loser being cancelled says nothing about Gemini's health
+        if not isinstance(error, asyncio.CancelledError):
+            breaker.record(error, probe)
+        elif probe:
+            breaker.abandon_probe()
+
+
+async def _agenerate_once(request, contents, call):
+    retry = 0
+    while True:
+        try:
+            return await _agenerate_attempt(request, contents, call)
+        except Exception as e:
+            delay = _throttle_backoff(request, retry, e)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        retry += 1
+
+
+def _hedge_delay(request):
+    """
+    Seconds to wait before hedging `request`, or None to not hedge it.
+    """
+    if not (AI_HEDGING and request.hedge):
+        return None
+    calls, p95 = telemetry.wall_p95(request.name)
+    return AI_HEDGE_DELAY_S if calls < AI_HEDGE_MIN_SAMPLES else p95
+
+
+async def _agenerate(request, contents, call):
+    delay = _hedge_delay(request)
+    if delay is None:
+        return await _agenerate_once(request, contents, call)
+
+    first = asyncio.ensure_future(_agenerate_once(request, contents, call))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    print(f"[ai] {request.name}: no answer after {delay:g}s, sending hedged request")
+    pending = {first, asyncio.ensure_future(_agenerate_once(request, contents, call))}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _finish(call, request, outcome, error=None):
+    # Prefer Gemini's usage_metadata; fall back to the pre-call count/estimate
+    if call.prompt_tokens is None:
+        call.prompt_tokens = request.prompt_tokens
+    call.finish(outcome, error)
+
+
+def run(request: AIRequest):
+    """
+    Executes an AIRequest with the shared sync client.
+    """
+    call = CallRecord(request.name, request.model)
+    hit, cached = ai_cache.get(request)
+    if hit:
+        call.finish(CACHE_HIT)
+        return cached
+    outcome = OK
+    try:
+        count_prompt_tokens(request)
+        response = _generate(request, request.contents, call)
+        try:
+            result = _parse(request, response)
+        except ValueError as e:
+            if request.schema is None:
+                raise e
+            print(f"Invalid output from {request.name}, retrying with repair prompt: {e}")
+            outcome = REPAIRED
+            response = _generate(request, _repair_prompt(response.text, e), call)
+            result = _parse(request, response)
+        ai_cache.put(request, result)
+        _finish(call, request, outcome)
+        return result
+    except Exception as e:
+        print(f"Error in {request.name}: {str(e)}")
+        # Background work is deferred by its caller rather than filled with fallbacks
+        if request.fallback is None or (isinstance(e, CircuitOpenError) and request.priority == BACKGROUND):
+            _finish(call, request, CIRCUIT_OPEN if isinstance(e, CircuitOpenError) else ERROR, e)
+            raise e
+        _finish(call, request, FALLBACK, e)
+        result = request.fallback(e)
+        if isinstance(result, AIRequest):
+            return run(result)
+        return result
+
+
+async def arun(request: AIRequest):
+    """
+    Executes an AIRequest through client.aio without blocking the event loop.
+    """
+    call = CallRecord(request.name, request.model)
+    hit, cached = await ai_cache.aget(request)
+    if hit:
+        call.finish(CACHE_HIT)
+        return cached
+    outcome = OK
+    try:
+        await acount_prompt_tokens(request)
+        response = await _agenerate(request, request.contents, call)
+        try:
+            result = _parse(request, response)
+        except ValueError as e:
+            if request.schema is None:
+                raise e
+            print(f"Invalid output from {request.name}, retrying with repair prompt: {e}")
+            outcome = REPAIRED
+            response = await _agenerate(request, _repair_prompt(response.text, e), call)
+            result = _parse(request, response)
+        ai_cache.put(request, result)
+        _finish(call, request, outcome)
+        return result
+    except Exception as e:
+        print(f"Error in {request.name}: {str(e)}")
+        # Background work is deferred by its caller rather than filled with fallbacks
+        if request.fallback is None or (isinstance(e, CircuitOpenError) and request.priority == BACKGROUND):
+            _finish(call, request, CIRCUIT_OPEN if isinstance(e, CircuitOpenError) else ERROR, e)
+            raise e
+        _finish(call, request, FALLBACK, e)
+        result = request.fallback(e)
+        if isinstance(result, AIRequest):
+            return await arun(result)
+        return result
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import threading
+from pymongo import ReturnDocument
+from app.database.connection import rate_limits_collection
+
+# Requests per minute allowed against Gemini across all workers
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 60))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", 10))
+# Share of the bucket background work may not dip into, kept for interactive calls
+BACKGROUND_RESERVE = float(os.getenv("GEMINI_BACKGROUND_RESERVE", 0.3))
+# "mongo" shares the bucket across processes; "local" keeps it in this process
+AI_RATE_LIMIT_BACKEND = os.getenv("AI_RATE_LIMIT_BACKEND", "mongo")
+# Upper bound for the adaptive in-process concurrency limit
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 8))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+BUCKET_ID = "gemini"
+POLL_INTERVAL = 0.05
+MAX_WAIT_STEP = 1.0
+
+
+def is_throttling_error(error):
+    """
+    True for Gemini 429 / RESOURCE_EXHAUSTED responses.
+    """
+    if getattr(error, "code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text
+
+
+class _LocalBucket:
+    def __init__(self, capacity, rate_per_sec):
+        self.capacity = capacity
+        self.rate = rate_per_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_take(self, minimum):
+        """
+        Takes one token if at least `minimum` are available; otherwise returns
+        the seconds until that will be the case.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= minimum:
+                self.tokens -= 1
+                return 0
+            return (minimum - self.tokens) / self.rate
+
+
+class _MongoBucket:
+    """
+    Token bucket stored in one Mongo document. Refill and take happen in a
+    single conditional find_one_and_update, so concurrent workers cannot
+    overdraw it. Elapsed time is measured with the server clock ($$NOW), so
+    clock skew between workers does not mint or lose tokens.
+    """
+
+    def __init__(self, capacity, rate_per_sec):
+        self.capacity = capacity
+        self.rate = rate_per_sec
+        self.ready = False
+
+    def _refilled(self):
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", "$updatedAt"]}, 1000]}
+        return {"$min": [self.capacity, {"$add": ["$tokens", {"$multiply": [{"$max": [0, elapsed]}, self.rate]}]}]}
+
+    def try_take(self, minimum):
+        if not self.ready:
+            rate_limits_collection.update_one(
+                {"_id": BUCKET_ID},
+                [{"$set": {
+                    "tokens": {"$ifNull": ["$tokens", self.capacity]},
+                    "updatedAt": {"$ifNull": ["$updatedAt", "$$NOW"]}
+                }}],
+                upsert=True
+            )
+            self.ready = True
+
+        taken = rate_limits_collection.find_one_and_update(
+            {"_id": BUCKET_ID, "$expr": {"$gte": [self._refilled(), minimum]}},
+            [{"$set": {"tokens": {"$subtract": [self._refilled(), 1]}, "updatedAt": "$$NOW"}}],
+            return_document=ReturnDocument.AFTER
+        )
+        if taken:
+            return 0
+        current = next(rate_limits_collection.aggregate([
+            {"$match": {"_id": BUCKET_ID}},
+            {"$project": {"tokens": self._refilled()}}
+        ]), {})
+        return max(POLL_INTERVAL, (minimum - current.get("tokens", 0)) / self.rate)
+
+
+class GeminiRateLimiter:
+    """
+    Admission control for Gemini calls: a token bucket for request rate plus an
+    AIMD-adjusted concurrency limit. Interactive calls may use the whole bucket
+    and jump ahead of waiting background calls; background calls leave
+    BACKGROUND_RESERVE of the bucket untouched.
+    """
+
+    def __init__(self):
+        rate = GEMINI_RPM / 60.0
+        self.local_bucket = _LocalBucket(GEMINI_BURST, rate)
+        self.mongo_bucket = _MongoBucket(GEMINI_BURST, rate) if AI_RATE_LIMIT_BACKEND == "mongo" else None
+        self.lock = threading.Lock()
+        self.limit = float(AI_MAX_CONCURRENCY)
+        self.in_flight = 0
+        self.waiting_interactive = 0
+        self.throttled = 0
+
+    def _take_token(self, priority):
+        minimum = 1 if priority == INTERACTIVE else 1 + BACKGROUND_RESERVE * GEMINI_BURST
+        if self.mongo_bucket:
+            try:
+                return self.mongo_bucket.try_take(minimum)
+            except Exception as e:
+                print(f"Warning: Shared rate limit unavailable, using local bucket: {e}")
+        return self.local_bucket.try_take(minimum)
+
+    def _try_acquire(self, priority):
+        """
+        Returns 0 once a concurrency slot and a token are held, otherwise the
+        suggested wait in seconds.
+        """
+        with self.lock:
+            if priority == BACKGROUND and self.waiting_interactive:
+                return POLL_INTERVAL
+            if self.in_flight >= int(self.limit):
+                return POLL_INTERVAL
+            self.in_flight += 1
+        wait = self._take_token(priority)
+        if wait:
+            with self.lock:
+                self.in_flight -= 1
+        return min(wait, MAX_WAIT_STEP)
+
+    def _waiting(self, priority, delta):
+        if priority == INTERACTIVE:
+            with self.lock:
+                self.waiting_interactive += delta
+
+    def acquire(self, priority=INTERACTIVE):
+        """
+        Blocks until the call may proceed. Returns the time spent waiting.
+        """
+        started = time.monotonic()
+        self._waiting(priority, 1)
+        try:
+            while True:
+                wait = self._try_acquire(priority)
+                if not wait:
+                    return time.monotonic() - started
+                time.sleep(wait)
+        finally:
+            self._waiting(priority, -1)
+
+    def _give_back(self, attempt):
+        """
+        Done-callback for an abandoned acquire attempt: frees the slot it may
+        still have taken after its waiter was cancelled.
+        """
+        if not attempt.cancelled() and attempt.exception() is None and not attempt.result():
+            with self.lock:
+                self.in_flight -= 1
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        """
+        Like acquire, but the shared bucket's Mongo round-trips run in a
+        worker thread so they do not block the event loop.
+        """
+        started = time.monotonic()
+        self._waiting(priority, 1)
+        try:
+            while True:
+                if self.mongo_bucket:
+                    attempt = asyncio.ensure_future(asyncio.to_thread(self._try_acquire, priority))
+                    try:
+                        wait = await asyncio.shield(attempt)
+                    except asyncio.CancelledError:
+                        attempt.add_done_callback(self._give_back)
+                        raise
+                else:
+                    wait = self._try_acquire(priority)
+                if not wait:
+                    return time.monotonic() - started
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting(priority, -1)
+
+    def release(self, error=None):
+        """
+        Frees the slot and adapts concurrency: halve on throttling, otherwise
+        grow by roughly one slot per `limit` successful calls.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            if error is not None and is_throttling_error(error):
+                self.throttled += 1
+                self.limit = max(1.0, self.limit / 2)
+                print(f"[ai] Gemini throttled; concurrency limit reduced to {int(self.limit)}")
+            elif error is None:
+                self.limit = min(float(AI_MAX_CONCURRENCY), self.limit + 1.0 / self.limit)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backend": "mongo" if self.mongo_bucket else "local",
+                "requestsPerMinute": GEMINI_RPM,
+                "burst": GEMINI_BURST,
+                "concurrencyLimit": int(self.limit),
+                "inFlight": self.in_flight,
+                "waitingInteractive": self.waiting_interactive,
+                "throttledResponses": self.throttled
+            }
+
+
+limiter = GeminiRateLimiter()
@@ -1,21 +1,26 @@
-import os
 import json
-from google import genai
-from dotenv import load_dotenv
 from datetime import datetime
+from app.services.ai_gateway import AIRequest, GEMINI_MODEL, BACKGROUND, AI_CALL_TIMEOUT_S, run, arun
+from app.services.prompt_encoder import encode_table, budget_for
+from app.schemas.ai import (
+    MCQQuestion, VideoQuestion, TestAnalysis, VideoAnswerEvaluation, BatchVideoAnswerEvaluation,
+    SkillGapReasoning, OverallVideoEvaluation, BridgePathContent, ConfirmationLetter, VideoAnswerAssessment
+)
 
-load_dotenv()
 
-# Configure Gemini using the working method from test.py
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash") # Fallback to 1.5 for deployment compatibility
+def _course_cache_inputs(course):
+    return {
+        "title": course.get("title"),
+        "description": course.get("description"),
+        "skills_required": course.get("skills_required", []),
+        "level": course.get("level")
+    }
 
-def generate_mcqs(course, count=10):
-    """
-    Generates MCQs for a given course using the new Google GenAI SDK.
-    """
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    
+
+def _course_cache_tags(course):
+    return [f"course:{course['_id']}"] if course.get("_id") else []
+
+def _generate_mcqs_request(course, count, refresh=False):
     prompt = f"""
     You are an expert educator.
     Generate {count} VERY BASIC level Multiple Choice Questions (MCQs) 
@@ -44,34 +49,29 @@ def generate_mcqs(course, count=10):
     - "relatedSkill" (the specific skill from the list this question tests)
     Return ONLY the JSON array.
     """
-    try:
-        # Using the model confirmed working in test.py
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        
-        text = response.text.strip()
-        
-        # Clean the response from markdown if present
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-        
-        return json.loads(text)
-    except Exception as e:
-        print(f"Error in generate_mcqs: {str(e)}")
-        raise e
-
-
-
-def generate_video_questions(course, count=6):
+    return AIRequest(
+        "generate_mcqs",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=list[MCQQuestion],
+        cache_inputs={"course": _course_cache_inputs(course), "count": count},
+        cache_tags=_course_cache_tags(course),
+        cache_refresh=refresh
+    )
+
+def generate_mcqs(course, count=10, refresh=False):
     """
-    Generate {count} basic domain specific questions for the course course using the new Google GenAI SDK.
+    Generates MCQs for a given course using the new Google GenAI SDK.
+    Pass refresh=True to bypass the response cache and force a new set.
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    return run(_generate_mcqs_request(course, count, refresh))
+
+async def generate_mcqs_async(course, count=10, refresh=False):
+    return await arun(_generate_mcqs_request(course, count, refresh))
+
+
 
+def _generate_video_questions_request(course, count, refresh=False):
     prompt = f"""
     You are an expert educator.
 
@@ -103,32 +103,27 @@ def generate_video_questions(course, count=6):
 
     Return ONLY the JSON array.
     """
-
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        
-        text = response.text.strip()
-        
-        # Clean the response from markdown if present
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-        
-        return json.loads(text)
-    except Exception as e:
-        print(f"Error in generate_video_questions: {str(e)}")
-        raise e
-
-def generate_retest_video_questions(course, previous_gaps, count=6):
+    return AIRequest(
+        "generate_video_questions",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=list[VideoQuestion],
+        cache_inputs={"course": _course_cache_inputs(course), "count": count},
+        cache_tags=_course_cache_tags(course),
+        cache_refresh=refresh
+    )
+
+def generate_video_questions(course, count=6, refresh=False):
     """
-    Generate {count} custom domain specific questions focused on previous skill gaps for a retest.
+    Generate {count} basic domain specific questions for the course course using the new Google GenAI SDK.
+    Pass refresh=True to bypass the response cache and force a new set.
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    return run(_generate_video_questions_request(course, count, refresh))
 
+async def generate_video_questions_async(course, count=6, refresh=False):
+    return await arun(_generate_video_questions_request(course, count, refresh))
+
+def _generate_retest_video_questions_request(course, previous_gaps, count):
     prompt = f"""
     You are an expert educator conducting a simplified retest interview for the course: "{course.get('title')}".
 
@@ -150,32 +145,45 @@ def generate_retest_video_questions(course, previous_gaps, count=6):
 
     Return ONLY the JSON array.
     """
-
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config={"response_mime_type": "application/json"}
-        )
-        return json.loads(response.text)
-    except Exception as e:
-        print(f"Error in generate_retest_video_questions: {str(e)}")
+    return AIRequest(
+        "generate_retest_video_questions",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=list[VideoQuestion],
         # Fallback to standard questions if AI fails
-        return generate_video_questions(course, count=count)
+        fallback=lambda e: _generate_video_questions_request(course, count),
+        cache_inputs={"course": _course_cache_inputs(course), "gaps": sorted(set(previous_gaps)), "count": count},
+        cache_tags=_course_cache_tags(course)
+    )
 
-def analyze_test_results(answers, course_title):
+def generate_retest_video_questions(course, previous_gaps, count=6):
     """
-    Analyzes student test answers to identify weak skills and provide recommendations.
+    Generate {count} custom domain specific questions focused on previous skill gaps for a retest.
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    
+    return run(_generate_retest_video_questions_request(course, previous_gaps, count))
+
+async def generate_retest_video_questions_async(course, previous_gaps, count=6):
+    return await arun(_generate_retest_video_questions_request(course, previous_gaps, count))
+
+def _analyze_test_results_request(answers, course_title):
+    # The selected answer only carries information when it was wrong
+    answer_rows = [
+        {**answer, "selectedAnswer": None if answer.get("isCorrect") else answer.get("selectedAnswer")}
+        for answer in answers
+    ]
+    answers_table = encode_table(
+        answer_rows,
+        ["question", "relatedSkill", "isCorrect", "selectedAnswer", "correctAnswer"],
+        token_budget=budget_for("analyze_test_results", 0.8)
+    )
+
     prompt = f"""
     You are an AI learning assistant. A student has just completed an MCQ assessment for the course "{course_title}".
     
     Based on the following question and answer log, identify the student's weak areas and provide specific learning recommendations.
     
-    Test Answers:
-    {json.dumps(answers, indent=2, default=str)}
+    Test Answers (pipe-separated table; isCorrect is Y/N; selectedAnswer is blank when correct):
+{answers_table}
     
     Requirements:
     1. Identify 2-3 specific weak skills/topics.
@@ -185,36 +193,29 @@ def analyze_test_results(answers, course_title):
     
     Return ONLY the JSON object.
     """
-
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        
-        text = response.text.strip()
-        
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-            
-        return json.loads(text)
-    except Exception as e:
-        print(f"Error in analyze_test_results: {str(e)}")
-        return {
+    return AIRequest(
+        "analyze_test_results",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=TestAnalysis,
+        fallback=lambda e: {
             "weak_skills": ["Needs review of the course material"],
             "recommendations": ["Review the core concepts of the course again."]
-        }
+        },
+        cache_inputs={"answers": answers, "courseTitle": course_title},
+        hedge=True
+    )
 
-def evaluate_video_answer(question_data, transcript, course_details):
+def analyze_test_results(answers, course_title):
     """
-    Evaluates a single video answer transcript using Gemini.
-    Structured for skill-based eligibility evaluation.
+    Analyzes student test answers to identify weak skills and provide recommendations.
     """
+    return run(_analyze_test_results_request(answers, course_title))
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
+async def analyze_test_results_async(answers, course_title):
+    return await arun(_analyze_test_results_request(answers, course_title))
 
+def _evaluate_video_answer_request(question_data, transcript, course_details):
     question_text = question_data.get("question")
     related_skill = question_data.get("relatedSkill")
     expected_concepts = question_data.get("expectedConcepts", [])
@@ -273,104 +274,295 @@ Return ONLY a valid JSON object in this format:
   "improvementSuggestions": []
 }}
 """
+    return AIRequest(
+        "evaluate_video_answer",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=VideoAnswerEvaluation,
+        fallback=lambda e: failed_video_evaluation(related_skill),
+        priority=BACKGROUND
+    )
+
+def failed_video_evaluation(related_skill):
+    """
+    Placeholder analysis stored when an answer could not be evaluated.
+    """
+    return {
+        "skill": related_skill,
+        "conceptCoverageScore": 0,
+        "technicalScore": 0,
+        "feedback": "Evaluation failed",
+        "improvementAreas": [],
+        "clarityScore": 0,
+        "overallScore": 0,
+        "skillLevelAssessment": "Weak",
+        "strengths": [],
+        "weakAreas": ["Evaluation failed"],
+        "improvementSuggestions": ["Retry evaluation"],
+        "evaluationFailed": True
+    }
+
+def silent_video_evaluation(related_skill):
+    """
+    Canonical analysis for an answer with no detectable speech.
+    """
+    return {
+        "skill": related_skill,
+        "conceptCoverageScore": 0,
+        "technicalScore": 0,
+        "feedback": "No spoken answer was detected in this video.",
+        "improvementAreas": ["Record a spoken answer to the question"],
+        "clarityScore": 0,
+        "overallScore": 0,
+        "skillLevelAssessment": "Weak",
+        "strengths": [],
+        "weakAreas": ["No answer provided"],
+        "improvementSuggestions": ["Check that the microphone is working and answer the question aloud"]
+    }
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config={"response_mime_type": "application/json"}
-        )
-
-        return json.loads(response.text)
-
-    except Exception as e:
-        print(f"Error in evaluate_video_answer: {str(e)}")
-        return {
-            "skill": related_skill,
-            "conceptCoverageScore": 0,
-            "technicalScore": 0,
-            "feedback": "Evaluation failed",
-            "improvementAreas": [],
-            "clarityScore": 0,
-            "overallScore": 0,
-            "skillLevelAssessment": "Weak",
-            "strengths": [],
-            "weakAreas": ["Evaluation failed"],
-            "improvementSuggestions": ["Retry evaluation"]
-        }
+def evaluate_video_answer(question_data, transcript, course_details):
+    """
+    Evaluates a single video answer transcript using Gemini.
+    Structured for skill-based eligibility evaluation.
+    """
+    return run(_evaluate_video_answer_request(question_data, transcript, course_details))
+
+async def evaluate_video_answer_async(question_data, transcript, course_details):
+    return await arun(_evaluate_video_answer_request(question_data, transcript, course_details))
+
+def _assess_video_answer_request(media, question_data, course_details, prompt_prefix, timeout):
+    related_skill = question_data.get("relatedSkill", "General")
+    prompt = f"""{prompt_prefix}
+You are a senior technical interviewer conducting a structured admission evaluation.
+
+Watch the student's answer video. First transcribe it, then evaluate the answer.
+
+Course Context:
+- Title: {course_details.get('title')}
+- Level: {course_details.get('level')}
+
+Evaluated Skill:
+{related_skill}
+
+Question:
+{question_data.get("question")}
+
+Expected Key Concepts:
+{question_data.get("expectedConcepts", [])}
+
+Transcription:
+- transcript: A highly accurate, word-for-word transcript of the speech, with no commentary or stage directions. If audio is empty, put "[Audio was empty or indiscernible]".
+- facialExpression: A short description of the main facial expression (e.g. "Neutral", "Smiling", "Nervous").
+- confidenceScore: A number out of 10 representing the student's confidence.
+
+Evaluation Guidelines (judge the transcript, not the delivery):
+
+1. Check how many expected concepts were correctly covered.
+2. Identify incorrect or misleading statements.
+3. Evaluate conceptual clarity.
+4. Evaluate explanation structure and coherence.
+5. Ignore minor grammar mistakes — focus on knowledge.
+
+Scoring Framework:
+
+- conceptCoverageScore (0–10): Coverage of expected concepts
+- technicalScore (0–10): Correctness of explanations
+- clarityScore (0–10): Structure and communication clarity
+- overallScore (0–10): Weighted evaluation
+- skillLevelAssessment: Strong / Moderate / Weak
+
+Return ONLY a valid JSON object in this format:
+
+{{
+  "transcript": "",
+  "facialExpression": "",
+  "confidenceScore": 0,
+  "skill": "",
+  "conceptCoverageScore": 0,
+  "technicalScore": 0,
+  "feedback": "",
+  "improvementAreas": [],
+  "clarityScore": 0,
+  "overallScore": 0,
+  "skillLevelAssessment": "",
+  "strengths": [],
+  "weakAreas": [],
+  "improvementSuggestions": []
+}}
+"""
+    return AIRequest(
+        "assess_video_answer",
+        [*media, prompt],
+        model="gemini-2.5-flash",
+        schema=VideoAnswerAssessment,
+        priority=BACKGROUND,
+        timeout=timeout
+    )
+
+async def assess_video_answer_async(media, question_data, course_details, prompt_prefix="", timeout=AI_CALL_TIMEOUT_S):
+    """
+    Transcribes and evaluates one answer video in a single call ("fused"
+    evaluation mode). `media` holds the video (or slimmed) parts. Returns the
+    transcription fields and the VideoAnswerEvaluation fields in one dict;
+    raises on failure so the caller can fall back to a plain transcription.
+    """
+    return await arun(_assess_video_answer_request(media, question_data, course_details, prompt_prefix, timeout))
 
-def discover_skill_gaps(mcq_answers, video_answers, course_details, threshold=6.5):
+def _order_batch_evaluations(expected_count):
     """
-    Consolidates MCQ marks (Theory) and Video metrics (Application) per skill,
-    comparing against a threshold to flag and categorize gaps.
+    Checks that the batch holds exactly one evaluation per answer and returns
+    them in answer order, so a partial batch triggers the repair/fallback path.
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    
+    def transform(evaluations):
+        by_index = {evaluation.pop("answerIndex"): evaluation for evaluation in evaluations}
+        if len(evaluations) != expected_count or set(by_index) != set(range(1, expected_count + 1)):
+            raise ValueError(f"Expected one evaluation for each answerIndex 1..{expected_count}, got {sorted(by_index)}")
+        return [by_index[i] for i in range(1, expected_count + 1)]
+    return transform
+
+def _evaluate_video_answers_batch_request(items, course_details):
+    answers_block = ""
+    for i, (question_data, transcript) in enumerate(items, start=1):
+        answers_block += f"""
+Answer {i}:
+- Evaluated Skill: {question_data.get("relatedSkill")}
+- Question: {question_data.get("question")}
+- Expected Key Concepts: {question_data.get("expectedConcepts", [])}
+- Student Transcript: {transcript}
+"""
+
     prompt = f"""
-    You are an AI gap discovery engine. Your task is to identify specific skill gaps for a student based on their assessment data.
-    
-    Course Context:
-    - Title: {course_details.get('title')}
-    - Required Skills: {', '.join(course_details.get('skills_required', []))}
-    - Difficulty: {course_details.get('level')}
-
-    Data Source 1: MCQ Answers (The student's theoretical knowledge)
-    {json.dumps(mcq_answers, indent=2, default=str)}
-    (Note: Each item has "isCorrect" and "relatedSkill")
-
-    Data Source 2: Video Test Evaluation (The student's practical application)
-    {json.dumps(video_answers, indent=2, default=str)}
-    (Note: Each item has "relatedSkill" and an "analysis" object containing "technicalScore" out of 10)
-
-    Requirement:
-    1. A skill is considered a "Gap" if its estimated proficiency is below {threshold}/10 (70%).
-    2. Consolidate a score for each skill mentioned in either the MCQ or Video data.
-    3. If a question is tagged with "General", try to map it to one of the Course Required Skills based on the question text.
-    4. Group identify gaps into logical "Categories" (e.g., Logic & Programming, Soft Skills, Domain Architecture).
-    5. Be specific in the "reasoning" about why it's a gap (e.g., "Student failed MCQ definitions for this topic and showed hesitation in the video explanation.")
-
-    Output strictly in this JSON format:
-    [
-      {{
-        "category": "Topic Category Name",
-        "skills": [
-          {{
-            "skillName": "Name of the Skill",
-            "score": 0.0,
-            "threshold": {threshold},
-            "isGap": true,
-            "reasoning": "Detailed explanation of why this was flagged"
-          }}
-        ]
-      }}
+You are a senior technical interviewer conducting a structured admission evaluation.
+
+Your task is to evaluate, answer by answer, whether the student demonstrates sufficient
+foundational knowledge in each evaluated skill area. Evaluate every answer independently.
+
+Course Context:
+- Title: {course_details.get('title')}
+- Level: {course_details.get('level')}
+{answers_block}
+Evaluation Guidelines:
+
+1. Check how many expected concepts were correctly covered.
+2. Identify incorrect or misleading statements.
+3. Evaluate conceptual clarity.
+4. Evaluate explanation structure and coherence.
+5. Ignore minor grammar mistakes — focus on knowledge.
+
+Scoring Framework:
+
+- conceptCoverageScore (0–10): Coverage of expected concepts
+- technicalScore (0–10): Correctness of explanations
+- clarityScore (0–10): Structure and communication clarity
+- overallScore (0–10): Weighted evaluation
+- skillLevelAssessment: Strong / Moderate / Weak
+
+Return ONLY a valid JSON array with exactly {len(items)} objects, one per answer, in this format:
+
+[
+  {{
+    "answerIndex": 1,
+    "skill": "",
+    "conceptCoverageScore": 0,
+    "technicalScore": 0,
+    "feedback": "",
+    "improvementAreas": [],
+    "clarityScore": 0,
+    "overallScore": 0,
+    "skillLevelAssessment": "",
+    "strengths": [],
+    "weakAreas": [],
+    "improvementSuggestions": []
+  }}
+]
+"""
+    return AIRequest(
+        "evaluate_video_answers_batch",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=list[BatchVideoAnswerEvaluation],
+        transform=_order_batch_evaluations(len(items)),
+        priority=BACKGROUND
+    )
+
+def evaluate_video_answers_batch(items, course_details):
+    """
+    Evaluates all answers of one submission in a single call.
+    :param items: List of (question_data, transcript) tuples.
+    :return: List of evaluations in the same order as `items`.
+    Raises if the response does not validate; callers fall back to evaluate_video_answer.
+    """
+    return run(_evaluate_video_answers_batch_request(items, course_details))
+
+async def evaluate_video_answers_batch_async(items, course_details):
+    return await arun(_evaluate_video_answers_batch_request(items, course_details))
+
+def _write_skill_gap_reasoning_request(gap_skills, video_answers, course_details):
+    gap_names = {skill.get("skillName") for skill in gap_skills}
+    video_notes = [
+        {
+            "skill": answer.get("relatedSkill"),
+            "feedback": (answer.get("analysis") or {}).get("feedback"),
+            "weakAreas": (answer.get("analysis") or {}).get("weakAreas", [])
+        }
+        for answer in video_answers if answer.get("relatedSkill") in gap_names
     ]
-    
-    If no significant gaps are found (< threshold), return an empty array [].
-    """
-    try:
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt,
-            config={"response_mime_type": "application/json"}
-        )
-        return json.loads(response.text)
-    except Exception as e:
-        print(f"Error in discover_skill_gaps: {str(e)}")
-        return []
 
-def generate_overall_video_evaluation(evaluations, course_details):
+    prompt = f"""
+    You are an AI learning assistant. The following skills were flagged as gaps for a student
+    in the course "{course_details.get('title')}" ({course_details.get('level')}).
+    The scores are final and were computed from their MCQ (theory) and video (application) results.
+
+    Flagged Skills (pipe-separated table, scores out of 10):
+{encode_table(gap_skills, ["skillName", "score", "theoryScore", "applicationScore"])}
+
+    Video Evaluator Notes (pipe-separated table):
+{encode_table(video_notes, ["skill", "feedback", "weakAreas"], token_budget=budget_for("write_skill_gap_reasoning", 0.7))}
+
+    Requirements:
+    1. For each flagged skill, write 1-2 sentences explaining specifically why it is a gap.
+    2. Refer to the theory/application evidence; do NOT change or restate different scores.
+    3. The output MUST be a JSON array of objects with "skillName" and "reasoning", one per flagged skill.
+
+    Return ONLY the JSON array.
     """
-    Generate an overall eligibility signal and summary based on all per-answer evaluations.
-    Provides a "Golden Report" containing competency gap, vibe check, and AI verdict.
+    return AIRequest(
+        "write_skill_gap_reasoning",
+        prompt,
+        model=GEMINI_MODEL,
+        schema=list[SkillGapReasoning],
+        transform=lambda items: {item["skillName"]: item["reasoning"] for item in items},
+        fallback=lambda e: {},
+        priority=BACKGROUND
+    )
+
+def write_skill_gap_reasoning(gap_skills, video_answers, course_details):
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    Optionally asks Gemini to phrase the reasoning for locally computed skill gaps.
+    Returns {skillName: reasoning}; empty on failure so callers keep the local text.
+    """
+    return run(_write_skill_gap_reasoning_request(gap_skills, video_answers, course_details))
+
+async def write_skill_gap_reasoning_async(gap_skills, video_answers, course_details):
+    return await arun(_write_skill_gap_reasoning_request(gap_skills, video_answers, course_details))
+
+def _generate_overall_video_evaluation_request(evaluations, course_details):
+    evaluations_table = encode_table(
+        evaluations,
+        [
+            "relatedSkill", "transcript", "facialExpression", "confidenceScore",
+            "analysis.conceptCoverageScore", "analysis.technicalScore", "analysis.clarityScore",
+            "analysis.skillLevelAssessment", "analysis.feedback", "analysis.weakAreas"
+        ],
+        token_budget=budget_for("generate_overall_video_evaluation", 0.85)
+    )
 
     prompt = f"""
     You are a senior admissions officer. Evaluate a student's overall eligibility for the course:
     Course: {course_details.get('title')} ({course_details.get('level')})
 
-    Below are the individual skill evaluations from their video test. It includes transcripts, facial expressions, and confidence scores:
-    {json.dumps(evaluations, indent=2, default=str)}
+    Below are the individual skill evaluations from their video test as a pipe-separated table (one row per answer, scores out of 10). It includes transcripts, facial expressions, and confidence scores:
+{evaluations_table}
 
     Requirements:
     1. Provide an overall eligibility signal: "Pass", "Borderline", or "Fail".
@@ -390,33 +582,35 @@ def generate_overall_video_evaluation(evaluations, course_details):
       "aiVerdict": ""
     }}
     """
-
-    try:
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt,
-            config={"response_mime_type": "application/json"}
-        )
-        return json.loads(response.text)
-    except Exception as e:
-        print(f"Error in generate_overall_video_evaluation: {str(e)}")
-        return {
+    return AIRequest(
+        "generate_overall_video_evaluation",
+        prompt,
+        model=GEMINI_MODEL,
+        schema=OverallVideoEvaluation,
+        fallback=lambda e: {
             "overallEligibilitySignal": "Borderline",
             "executiveSummary": "Manual review required due to evaluation error.",
             "overallReasoning": "Technical error during overall evaluation aggregation.",
             "competencyGap": "Unable to determine",
             "vibeCheck": "Unable to determine",
             "aiVerdict": "Unable to determine"
-        }
+        },
+        priority=BACKGROUND
+    )
 
-def generate_bridge_path_b_content(skill_gaps):
+def generate_overall_video_evaluation(evaluations, course_details):
     """
-    Generate an AI Concept Checklist with at least 4 internet reference links based on skill gaps.
+    Generate an overall eligibility signal and summary based on all per-answer evaluations.
+    Provides a "Golden Report" containing competency gap, vibe check, and AI verdict.
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    return run(_generate_overall_video_evaluation_request(evaluations, course_details))
+
+async def generate_overall_video_evaluation_async(evaluations, course_details):
+    return await arun(_generate_overall_video_evaluation_request(evaluations, course_details))
 
+def _generate_bridge_path_b_content_request(skill_gaps):
     prompt = f"""
-    The student has failed the following skills for the course: {json.dumps(skill_gaps, indent=2)}.
+    The student has failed the following skills for the course: {json.dumps(skill_gaps)}.
     Generate a Step-by-Step Concept Roadmap for these skills.
 
     Requirements:
@@ -437,17 +631,12 @@ def generate_bridge_path_b_content(skill_gaps):
       ]
     }}
     """
-
-    try:
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt,
-            config={"response_mime_type": "application/json"}
-        )
-        return json.loads(response.text)
-    except Exception as e:
-        print(f"Error in generate_bridge_path_b_content: {{str(e)}}")
-        return {
+    return AIRequest(
+        "generate_bridge_path_b_content",
+        prompt,
+        model=GEMINI_MODEL,
+        schema=BridgePathContent,
+        fallback=lambda e: {
             "checklist": [
                 { "concept": "General Assessment Review", "difficulty": "EASY", "description": "Review the basic principles of the course material." }
             ],
@@ -457,14 +646,21 @@ def generate_bridge_path_b_content(skill_gaps):
                 { "title": "W3Schools", "url": "https://www.w3schools.com" },
                 { "title": "GeeksforGeeks", "url": "https://www.geeksforgeeks.org" }
             ]
-        }
+        },
+        cache_inputs={"skillGaps": sorted(set(skill_gaps))},
+        hedge=True
+    )
 
-def generate_confirmation_letter(student_name, course_title, overall_score, settings=None):
+def generate_bridge_path_b_content(skill_gaps):
     """
-    Generates a personalized, professional formal confirmation letter for an approved student.
+    Generate an AI Concept Checklist with at least 4 internet reference links based on skill gaps.
     """
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    
+    return run(_generate_bridge_path_b_content_request(skill_gaps))
+
+async def generate_bridge_path_b_content_async(skill_gaps):
+    return await arun(_generate_bridge_path_b_content_request(skill_gaps))
+
+def _generate_confirmation_letter_request(student_name, course_title, overall_score, settings):
     # Use provided settings or defaults
     inst_name = settings.get("instituteName", "SkillBridge AI Academy") if settings else "SkillBridge AI Academy"
     inst_addr = settings.get("instituteAddress", "123 Learning Lane, Tech City") if settings else "123 Learning Lane, Tech City"
@@ -503,21 +699,31 @@ def generate_confirmation_letter(student_name, course_title, overall_score, sett
     - Professional and authoritative tone.
     - Standard formal letter layout.
     - Around 200-250 words.
-    - Return ONLY the final letter as plain text.
-    """
-
-    try:
-        current_date = datetime.now().strftime("%B %d, %Y")
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        return response.text.strip()
-    except Exception as e:
-        print(f"Error in generate_confirmation_letter: {str(e)}")
+    - Return a JSON object with a single key "letter" holding the final letter as plain text.
+    """
+
+    def fallback(e):
         # Fallback to a basic template
         try:
             current_date = datetime.now().strftime("%B %d, %Y")
         except:
             current_date = "Official Date"
         return f"{inst_name}\n{inst_addr}\n{inst_web}\n\nDate: {current_date}\n\nTo: {student_name}\nSubject: CONFIRMATION OF ADMISSION\n\nDear {student_name},\n\nCongratulations! We are pleased to inform you that you have been approved for enrollment in the {course_title} program with a score of {overall_score}/100. We are excited to have you join us.\n\nSincerely,\n{inst_sig}"
+
+    return AIRequest(
+        "generate_confirmation_letter",
+        prompt,
+        model="gemini-2.5-flash",
+        schema=ConfirmationLetter,
+        transform=lambda data: data["letter"].strip(),
+        fallback=fallback
+    )
+
+def generate_confirmation_letter(student_name, course_title, overall_score, settings=None):
+    """
+    Generates a personalized, professional formal confirmation letter for an approved student.
+    """
+    return run(_generate_confirmation_letter_request(student_name, course_title, overall_score, settings))
+
+async def generate_confirmation_letter_async(student_name, course_title, overall_score, settings=None):
+    return await arun(_generate_confirmation_letter_request(student_name, course_title, overall_score, settings))
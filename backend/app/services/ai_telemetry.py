@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from app.database.connection import ai_call_logs_collection
+
+# Share of successful calls written to ai_call_logs; failures are always written
+AI_TELEMETRY_SAMPLE_RATE = float(os.getenv("AI_TELEMETRY_SAMPLE_RATE", 0.1))
+AI_CALL_LOG_TTL_DAYS = int(os.getenv("AI_CALL_LOG_TTL_DAYS", 14))
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128]
+
+OK = "ok"
+REPAIRED = "repaired"
+CACHE_HIT = "cache_hit"
+FALLBACK = "fallback"
+ERROR = "error"
+CIRCUIT_OPEN = "circuit_open"
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-th quantile ("+Inf" past the last bound).
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else "+Inf"
+
+    def to_dict(self):
+        labels = [f"le_{bound}" for bound in self.bounds] + ["+Inf"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class _FunctionStats:
+    def __init__(self):
+        self.wall = Histogram()
+        self.queue_wait = Histogram()
+        self.outcomes = {}
+        self.models = {}
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.retries = 0
+
+    def to_dict(self):
+        calls = sum(self.outcomes.values())
+        return {
+            "calls": calls,
+            "outcomes": dict(self.outcomes),
+            "models": dict(self.models),
+            "cacheHitRatio": round(self.outcomes.get(CACHE_HIT, 0) / calls, 3) if calls else 0,
+            "promptTokens": self.prompt_tokens,
+            "responseTokens": self.response_tokens,
+            "retries": self.retries,
+            "wallSeconds": self.wall.to_dict(),
+            "queueWaitSeconds": self.queue_wait.to_dict()
+        }
+
+
+class CallRecord:
+    """
+    Measurements for one logical AI call (all attempts, repair and hedge
+    requests included).
+    """
+
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+        self.started = time.monotonic()
+        self.queue_wait = 0.0
+        self.attempts = 0
+        self.prompt_tokens = None
+        self.response_tokens = 0
+        self.outcome = OK
+        self.error = None
+
+    def attempt(self, queue_wait):
+        self.attempts += 1
+        self.queue_wait += queue_wait or 0
+
+    def add_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        if usage.prompt_token_count is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + usage.prompt_token_count
+        self.response_tokens += usage.candidates_token_count or 0
+
+    def finish(self, outcome=None, error=None):
+        if outcome:
+            self.outcome = outcome
+        if error is not None:
+            self.error = str(error)[:500]
+        telemetry.record(self)
+
+
+class Telemetry:
+    """
+    Aggregates CallRecords into per-function histograms and writes a sample of
+    them to the ai_call_logs collection.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.functions = {}
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai-telemetry")
+        self.indexes_ready = False
+
+    def record(self, call: CallRecord):
+        wall = time.monotonic() - call.started
+        with self.lock:
+            stats = self.functions.setdefault(call.name, _FunctionStats())
+            stats.outcomes[call.outcome] = stats.outcomes.get(call.outcome, 0) + 1
+            stats.models[call.model] = stats.models.get(call.model, 0) + 1
+            if call.outcome != CACHE_HIT:
+                stats.wall.observe(wall)
+                stats.queue_wait.observe(call.queue_wait)
+            stats.prompt_tokens += call.prompt_tokens or 0
+            stats.response_tokens += call.response_tokens
+            stats.retries += max(0, call.attempts - 1)
+
+        if call.error or random.random() < AI_TELEMETRY_SAMPLE_RATE:
+            self.writer.submit(self._store, {
+                "function": call.name,
+                "model": call.model,
+                "outcome": call.outcome,
+                "wallSeconds": round(wall, 3),
+                "queueWaitSeconds": round(call.queue_wait, 3),
+                "promptTokens": call.prompt_tokens,
+                "responseTokens": call.response_tokens,
+                "attempts": call.attempts,
+                "error": call.error,
+                "createdAt": datetime.utcnow()
+            })
+
+    def _store(self, doc):
+        try:
+            if not self.indexes_ready:
+                ai_call_logs_collection.create_index("createdAt", expireAfterSeconds=AI_CALL_LOG_TTL_DAYS * 86400)
+                ai_call_logs_collection.create_index([("function", 1), ("createdAt", -1)])
+                self.indexes_ready = True
+            ai_call_logs_collection.insert_one(doc)
+        except Exception as e:
+            print(f"Warning: Failed to store AI call log: {e}")
+
+    @contextmanager
+    def track(self, name, model):
+        """
+        Times a Gemini call that does not go through the gateway (file uploads,
+        processing waits).
+        """
+        call = CallRecord(name, model)
+        call.attempt(0)
+        try:
+            yield call
+        except Exception as e:
+            call.finish(ERROR, e)
+            raise
+        call.finish()
+
+    def wall_p95(self, name):
+        """
+        Returns (timed calls, p95 wall seconds) for a function. The p95 is a
+        bucket upper bound, None when there are no calls or it is past the last bucket.
+        """
+        with self.lock:
+            stats = self.functions.get(name)
+            if stats is None:
+                return 0, None
+            p95 = stats.wall.quantile(0.95)
+            return stats.wall.count, None if p95 == "+Inf" else p95
+
+    def stats(self):
+        with self.lock:
+            return {name: stats.to_dict() for name, stats in sorted(self.functions.items())}
+
+
+telemetry = Telemetry()
@@ -1,5 +1,8 @@
+import re
+import time
 import cloudinary
 import cloudinary.uploader
+import cloudinary.utils
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -8,6 +11,10 @@ from pathlib import Path
 env_path = Path(__file__).parent.parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+# Videos go to Cloudinary in chunks of this size (Cloudinary needs at least 5 MB per chunk),
+# so an upload holds at most one chunk in memory
+VIDEO_UPLOAD_CHUNK_SIZE = int(os.getenv("VIDEO_UPLOAD_CHUNK_SIZE", 6 * 1024 * 1024))
+
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
     api_key=os.getenv("CLOUDINARY_API_KEY"),
@@ -15,21 +22,95 @@ cloudinary.config(
     secure=True
 )
 
+# Where browsers send signed direct uploads; point it at local_storage_server.py to work offline
+CLOUDINARY_UPLOAD_URL = os.getenv(
+    "CLOUDINARY_UPLOAD_URL",
+    f"https://api.cloudinary.com/v1_1/{os.getenv('CLOUDINARY_CLOUD_NAME')}/video/upload"
+)
+# Public URL of /student/video-upload-notification; when set, storage reports each finished upload there
+VIDEO_UPLOAD_NOTIFICATION_URL = os.getenv("VIDEO_UPLOAD_NOTIFICATION_URL")
+# Serve stored videos from here instead of Cloudinary's delivery host (e.g. local_storage_server.py's
+# http://localhost:9000/files)
+CLOUDINARY_DELIVERY_URL = os.getenv("CLOUDINARY_DELIVERY_URL")
+# How long signed upload parameters and upload notifications stay valid
+SIGNED_UPLOAD_TTL_S = int(os.getenv("SIGNED_UPLOAD_TTL_S", 3600))
+
+
+def video_folder(course_title, student_id):
+    # Sanitize course title for folder name
+    safe_course_title = re.sub(r'[^a-zA-Z0-9_-]', '_', course_title)
+    return f"student_videos/{safe_course_title}/student_{student_id}"
+
+
+def signed_upload_params(folder_path, public_id):
+    """
+    Form fields a client posts to CLOUDINARY_UPLOAD_URL (with the video as
+    "file") to upload straight to storage under `folder_path/public_id`.
+    """
+    params = {
+        "timestamp": int(time.time()),
+        "folder": folder_path,
+        "public_id": public_id,
+        "overwrite": "true"
+    }
+    if VIDEO_UPLOAD_NOTIFICATION_URL:
+        params["notification_url"] = VIDEO_UPLOAD_NOTIFICATION_URL
+    config = cloudinary.config()
+    return {
+        "uploadUrl": CLOUDINARY_UPLOAD_URL,
+        "fields": {
+            **params,
+            "api_key": config.api_key,
+            "signature": cloudinary.utils.api_sign_request(params, config.api_secret)
+        }
+    }
+
+
+def verify_upload_result(public_id, version, signature):
+    """
+    True if an upload response relayed by a client was really issued by storage.
+    """
+    return cloudinary.utils.verify_api_response_signature(public_id, version, signature)
+
+
+def video_delivery_url(public_id, version, format=None):
+    """
+    Delivery URL of an uploaded video, built only from values storage signed
+    (a client-supplied URL is never stored or downloaded).
+    """
+    if format and not re.fullmatch(r"[a-z0-9]{2,5}", format):
+        format = None
+    if CLOUDINARY_DELIVERY_URL:
+        # Versioned like Cloudinary's, so a re-upload under the same public_id gets a new URL
+        return f"{CLOUDINARY_DELIVERY_URL.rstrip('/')}/v{int(version)}/{public_id}" + (f".{format}" if format else "")
+    url, _ = cloudinary.utils.cloudinary_url(public_id, resource_type="video", version=version, format=format, secure=True)
+    return url
+
+
+def verify_upload_notification(body, timestamp, signature):
+    """
+    True if a notification body (raw string) carries a valid X-Cld-Signature.
+    """
+    if not timestamp or not signature:
+        return False
+    return cloudinary.utils.verify_notification_signature(body, timestamp, signature, valid_for=SIGNED_UPLOAD_TTL_S)
+
 def upload_video(file, folder_path, public_id):
     """
-    Uploads a video to Cloudinary.
-    :param file: The file object or path to the file.
+    Uploads a video to Cloudinary in VIDEO_UPLOAD_CHUNK_SIZE chunks.
+    :param file: The file object (read from its current position and closed) or path to the file.
     :param folder_path: The folder path in Cloudinary.
     :param public_id: The public ID (filename) for the video.
     :return: The Cloudinary upload response.
     """
     try:
-        response = cloudinary.uploader.upload(
+        response = cloudinary.uploader.upload_large(
             file,
             resource_type="video",
             folder=folder_path,
             public_id=public_id,
-            overwrite=True
+            overwrite=True,
+            chunk_size=VIDEO_UPLOAD_CHUNK_SIZE
         )
         return response
     except Exception as e:
@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+import weakref
+from app.services.ai_gateway import get_async_client
+from app.services.ai_telemetry import CallRecord, ERROR
+
+# First poll delay, growth factor and cap (seconds) for Gemini file state polling
+FILE_POLL_INITIAL_S = float(os.getenv("FILE_POLL_INITIAL_S", 0.25))
+FILE_POLL_BACKOFF = float(os.getenv("FILE_POLL_BACKOFF", 2))
+FILE_POLL_MAX_S = float(os.getenv("FILE_POLL_MAX_S", 4))
+GEMINI_PROCESSING_TIMEOUT_S = float(os.getenv("GEMINI_PROCESSING_TIMEOUT_S", 300))
+
+
+class FileProcessingError(Exception):
+    """
+    Raised when Gemini reports an uploaded file as FAILED.
+    """
+
+
+class _PendingFile:
+    def __init__(self, uploaded_file, timeout):
+        now = time.monotonic()
+        self.file = uploaded_file
+        self.future = asyncio.get_running_loop().create_future()
+        self.interval = FILE_POLL_INITIAL_S
+        self.next_poll = now + self.interval
+        self.deadline = now + timeout
+        self.timeout = timeout
+        self.call = CallRecord("gemini_file_processing", "files")
+
+
+class FileStatePoller:
+    """
+    Waits for uploaded Gemini files to leave the PROCESSING state.
+
+    All pending files of an event loop are polled by one task. Each file is
+    polled after FILE_POLL_INITIAL_S, then at exponentially growing intervals
+    capped at FILE_POLL_MAX_S, so short clips are picked up quickly and long
+    ones do not flood files.get.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.task = None
+        self.wakeup = asyncio.Event()
+
+    async def wait(self, uploaded_file, timeout=GEMINI_PROCESSING_TIMEOUT_S):
+        """
+        Returns the file once it is ACTIVE. Raises FileProcessingError if Gemini
+        failed to process it and TimeoutError after `timeout` seconds.
+        """
+        if uploaded_file.state.name != "PROCESSING":
+            return _check(uploaded_file)
+
+        entry = _PendingFile(uploaded_file, timeout)
+        self.pending[uploaded_file.name] = entry
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        self.wakeup.set()
+        try:
+            return await entry.future
+        finally:
+            self.pending.pop(uploaded_file.name, None)
+
+    async def _run(self):
+        client = get_async_client()
+        while self.pending:
+            now = time.monotonic()
+            due = [entry for entry in self.pending.values() if entry.next_poll <= now and not entry.future.done()]
+            results = await asyncio.gather(
+                *[client.files.get(name=entry.file.name) for entry in due],
+                return_exceptions=True
+            )
+            now = time.monotonic()
+            for entry, result in zip(due, results):
+                entry.call.attempt(0)
+                if isinstance(result, BaseException):
+                    print(f"Warning: Polling {entry.file.name} failed, will retry: {result}")
+                elif result.state.name != "PROCESSING":
+                    self._resolve(entry, result)
+                    continue
+                if now >= entry.deadline:
+                    self._fail(entry, TimeoutError(
+                        f"Gemini did not finish processing {entry.file.name} within {entry.timeout:g}s"
+                    ))
+                    continue
+                entry.interval = min(FILE_POLL_MAX_S, entry.interval * FILE_POLL_BACKOFF)
+                entry.next_poll = now + entry.interval
+
+            waiting = [entry.next_poll for entry in self.pending.values() if not entry.future.done()]
+            if not waiting:
+                # Give waiters a chance to remove their resolved entries
+                await asyncio.sleep(0)
+                continue
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(0, min(waiting) - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    def _resolve(self, entry, uploaded_file):
+        try:
+            result = _check(uploaded_file)
+        except FileProcessingError as e:
+            return self._fail(entry, e)
+        entry.call.finish()
+        if not entry.future.done():
+            entry.future.set_result(result)
+
+    def _fail(self, entry, error):
+        entry.call.finish(ERROR, error)
+        if not entry.future.done():
+            entry.future.set_exception(error)
+
+
+def _check(uploaded_file):
+    if uploaded_file.state.name == "FAILED":
+        raise FileProcessingError("Gemini failed to process the uploaded video file.")
+    return uploaded_file
+
+
+# Futures are bound to their loop, so each event loop gets its own poller
+_pollers = weakref.WeakKeyDictionary()
+
+
+async def wait_until_active(uploaded_file, timeout=GEMINI_PROCESSING_TIMEOUT_S):
+    loop = asyncio.get_running_loop()
+    poller = _pollers.get(loop)
+    if poller is None:
+        poller = _pollers[loop] = FileStatePoller()
+    return await poller.wait(uploaded_file, timeout)
@@ -0,0 +1,185 @@
+import os
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from app.database.connection import jobs_collection
+
+# How long a claimed job stays owned by a worker without a heartbeat
+JOB_LEASE_S = int(os.getenv("JOB_LEASE_S", 120))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+# Retry delay is JOB_RETRY_BASE_S * 2^(attempt - 1), capped at JOB_RETRY_MAX_S
+JOB_RETRY_BASE_S = int(os.getenv("JOB_RETRY_BASE_S", 30))
+JOB_RETRY_MAX_S = int(os.getenv("JOB_RETRY_MAX_S", 1800))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+_indexes_ready = False
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        jobs_collection.create_index([("status", 1), ("runAt", 1)])
+        jobs_collection.create_index([("status", 1), ("leaseUntil", 1)])
+        _indexes_ready = True
+
+
+def enqueue(job_type, payload, delay_s=0, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Adds a job to the durable queue and returns its id.
+    """
+    _ensure_indexes()
+    now = datetime.utcnow()
+    result = jobs_collection.insert_one({
+        "type": job_type,
+        "payload": payload,
+        "status": QUEUED,
+        "attempts": 0,
+        "maxAttempts": max_attempts,
+        "runAt": now + timedelta(seconds=delay_s),
+        "createdAt": now,
+        "updatedAt": now
+    })
+    return result.inserted_id
+
+
+def _has_attempts_left(left):
+    return {"$expr": {
+        "$lt" if left else "$gte": ["$attempts", {"$ifNull": ["$maxAttempts", JOB_MAX_ATTEMPTS]}]
+    }}
+
+
+def _bury_abandoned(job_types, now):
+    """
+    Dead-letters expired-lease jobs that have used all their attempts, e.g. a
+    video that takes its worker down every time it is processed.
+    """
+    result = jobs_collection.update_many(
+        {"type": {"$in": list(job_types)}, "status": RUNNING, "leaseUntil": {"$lt": now}, **_has_attempts_left(False)},
+        {
+            "$set": {"status": DEAD, "deadAt": now, "updatedAt": now,
+                     "lastError": "Worker stopped heartbeating on the last attempt"},
+            "$unset": {"leaseUntil": ""}
+        }
+    )
+    if result.modified_count:
+        print(f"Moved {result.modified_count} abandoned jobs to dead letter")
+
+
+def claim(worker_id, job_types):
+    """
+    Leases the next due job of one of `job_types` to `worker_id`. Jobs whose
+    lease expired (their worker died) are claimed again while they have
+    attempts left, and dead-lettered otherwise. Returns the job or None.
+    """
+    _ensure_indexes()
+    now = datetime.utcnow()
+    _bury_abandoned(job_types, now)
+    return jobs_collection.find_one_and_update(
+        {
+            "type": {"$in": list(job_types)},
+            "$or": [
+                {"status": QUEUED, "runAt": {"$lte": now}},
+                {"status": RUNNING, "leaseUntil": {"$lt": now}, **_has_attempts_left(True)}
+            ]
+        },
+        {
+            "$set": {
+                "status": RUNNING,
+                "workerId": worker_id,
+                "leaseUntil": now + timedelta(seconds=JOB_LEASE_S),
+                "heartbeatAt": now,
+                "startedAt": now,
+                "updatedAt": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("runAt", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def heartbeat(job, worker_id):
+    """
+    Extends the lease of a running job. Returns False if the worker no longer
+    owns it (the lease expired and another worker took over).
+    """
+    now = datetime.utcnow()
+    result = jobs_collection.update_one(
+        {"_id": job["_id"], "status": RUNNING, "workerId": worker_id},
+        {"$set": {"leaseUntil": now + timedelta(seconds=JOB_LEASE_S), "heartbeatAt": now, "updatedAt": now}}
+    )
+    return result.modified_count == 1
+
+
+def complete(job, worker_id):
+    now = datetime.utcnow()
+    jobs_collection.update_one(
+        {"_id": job["_id"], "workerId": worker_id},
+        {"$set": {"status": DONE, "completedAt": now, "updatedAt": now}, "$unset": {"leaseUntil": ""}}
+    )
+
+
+def fail(job, worker_id, error):
+    """
+    Schedules a retry with exponential backoff, or moves the job to the dead
+    letter state once it has used all its attempts. Returns True in that case.
+    """
+    now = datetime.utcnow()
+    attempts = job.get("attempts", 1)
+    update = {"lastError": str(error)[:1000], "updatedAt": now}
+    if attempts >= job.get("maxAttempts", JOB_MAX_ATTEMPTS):
+        update.update({"status": DEAD, "deadAt": now})
+        print(f"Job {job['_id']} ({job['type']}) moved to dead letter after {attempts} attempts: {error}")
+    else:
+        delay = min(JOB_RETRY_MAX_S, JOB_RETRY_BASE_S * 2 ** (attempts - 1))
+        update.update({"status": QUEUED, "runAt": now + timedelta(seconds=delay)})
+        print(f"Job {job['_id']} ({job['type']}) failed, retrying in {delay}s: {error}")
+    jobs_collection.update_one(
+        {"_id": job["_id"], "workerId": worker_id},
+        {"$set": update, "$unset": {"leaseUntil": ""}}
+    )
+    return update["status"] == DEAD
+
+
+def postpone(job, worker_id, delay_s, reason):
+    """
+    Puts a job back in the queue without spending an attempt (e.g. while the
+    Gemini circuit breaker is open).
+    """
+    now = datetime.utcnow()
+    jobs_collection.update_one(
+        {"_id": job["_id"], "workerId": worker_id},
+        {
+            "$set": {"status": QUEUED, "runAt": now + timedelta(seconds=delay_s), "lastError": reason, "updatedAt": now},
+            "$inc": {"attempts": -1},
+            "$unset": {"leaseUntil": ""}
+        }
+    )
+
+
+def requeue(job_id):
+    """
+    Sends a dead-lettered job back to the queue with a fresh set of attempts.
+    """
+    now = datetime.utcnow()
+    result = jobs_collection.update_one(
+        {"_id": job_id, "status": DEAD},
+        {"$set": {"status": QUEUED, "attempts": 0, "runAt": now, "updatedAt": now}, "$unset": {"deadAt": ""}}
+    )
+    return result.modified_count == 1
+
+
+def stats():
+    counts = {status: 0 for status in (QUEUED, RUNNING, DONE, DEAD)}
+    for row in jobs_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    dead = list(jobs_collection.find(
+        {"status": DEAD},
+        {"type": 1, "payload.studentId": 1, "payload.courseId": 1, "lastError": 1, "deadAt": 1}
+    ).sort("deadAt", -1).limit(20))
+    for job in dead:
+        job["_id"] = str(job["_id"])
+    return {"counts": counts, "recentDead": dead}
@@ -0,0 +1,165 @@
+import os
+import uuid
+import socket
+import asyncio
+import time
+import threading
+from app.services import job_queue
+from app.services.ai_circuit_breaker import breaker, CircuitOpenError
+
+# Jobs one worker process runs at the same time
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 2))
+JOB_POLL_INTERVAL_S = float(os.getenv("JOB_POLL_INTERVAL_S", 2))
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", 30))
+# Delay between heartbeat retries after a failed (e.g. Mongo unreachable) heartbeat
+HEARTBEAT_RETRY_S = 5
+# Run a job worker inside the API process unless dedicated workers (worker.py) are deployed
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "true").lower() == "true"
+# How often a worker deletes stale spooled videos
+SPOOL_SWEEP_INTERVAL_S = 3600
+
+TRANSCRIBE_VIDEOS = "transcribe_videos"
+
+
+async def _transcribe_videos(payload):
+    from app.services.transcription_service import transcribe_videos
+    await transcribe_videos(payload["studentId"], payload["courseId"], payload["videoUrls"], payload.get("localVideos"))
+
+
+def _discard_transcription_videos(payload):
+    from app.services.transcription_service import discard_local_videos
+    discard_local_videos(payload.get("localVideos"))
+
+
+HANDLERS = {
+    TRANSCRIBE_VIDEOS: _transcribe_videos
+}
+
+# Cleanup for jobs that end up in the dead letter state
+DEAD_LETTER_HANDLERS = {
+    TRANSCRIBE_VIDEOS: _discard_transcription_videos
+}
+
+
+def enqueue_transcription(student_id, course_id, video_urls, local_videos=None):
+    """
+    Queues the transcription → video analysis chain for a submission.
+    """
+    return job_queue.enqueue(TRANSCRIBE_VIDEOS, {
+        "studentId": student_id,
+        "courseId": course_id,
+        "videoUrls": video_urls,
+        "localVideos": local_videos or {}
+    })
+
+
+async def _keep_lease(job, worker_id, handler):
+    lease_until = time.monotonic() + job_queue.JOB_LEASE_S
+    delay = JOB_HEARTBEAT_S
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            renewed = await asyncio.to_thread(job_queue.heartbeat, job, worker_id)
+        except Exception as e:
+            # Keep trying until the lease would have expired; after that another worker may claim it
+            delay = min(JOB_HEARTBEAT_S, HEARTBEAT_RETRY_S)
+            if time.monotonic() + delay < lease_until:
+                print(f"Warning: Heartbeat for job {job['_id']} failed, retrying: {e}")
+                continue
+            renewed = False
+        if not renewed:
+            # Another worker may already have re-claimed it; stop so the job does not run twice
+            print(f"Warning: Lost lease on job {job['_id']}; cancelling it here")
+            handler.cancel()
+            return
+        lease_until = time.monotonic() + job_queue.JOB_LEASE_S
+        delay = JOB_HEARTBEAT_S
+
+
+async def _execute(job, worker_id, slots):
+    print(f"[worker {worker_id}] Running job {job['_id']} ({job['type']}), attempt {job['attempts']}")
+    handler = asyncio.create_task(HANDLERS[job["type"]](job["payload"]))
+    lease = asyncio.create_task(_keep_lease(job, worker_id, handler))
+    try:
+        await handler
+        job_queue.complete(job, worker_id)
+    except asyncio.CancelledError:
+        # Lease lost: the job is no longer ours to complete or fail
+        if not lease.done():
+            raise
+    except CircuitOpenError as e:
+        # Resume once the breaker lets a probe through; this does not use up an attempt
+        job_queue.postpone(job, worker_id, max(JOB_POLL_INTERVAL_S, breaker.retry_after()), str(e))
+    except Exception as e:
+        if job_queue.fail(job, worker_id, e) and job["type"] in DEAD_LETTER_HANDLERS:
+            DEAD_LETTER_HANDLERS[job["type"]](job["payload"])
+    finally:
+        lease.cancel()
+        slots.release()
+
+
+async def run_worker(worker_id=None, concurrency=JOB_CONCURRENCY, stop=None):
+    """
+    Claims and runs queued jobs until `stop` (an asyncio.Event) is set.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop = stop or asyncio.Event()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    last_sweep = None
+    print(f"Job worker {worker_id} started (concurrency {concurrency})")
+
+    while not stop.is_set():
+        if last_sweep is None or time.monotonic() - last_sweep >= SPOOL_SWEEP_INTERVAL_S:
+            last_sweep = time.monotonic()
+            from app.services.transcription_service import sweep_spooled_videos
+            await asyncio.to_thread(sweep_spooled_videos)
+        await slots.acquire()
+        try:
+            job = job_queue.claim(worker_id, HANDLERS.keys())
+        except Exception as e:
+            print(f"Warning: Failed to claim job: {e}")
+            job = None
+        if not job:
+            slots.release()
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(_execute(job, worker_id, slots))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    # Unfinished jobs keep their lease and are re-claimed after it expires
+    for task in running:
+        task.cancel()
+    print(f"Job worker {worker_id} stopped")
+
+
+class WorkerThread(threading.Thread):
+    """
+    Runs run_worker on its own event loop in a daemon thread, so jobs embedded
+    in the API process never share (or block) the request loop.
+    """
+
+    def __init__(self, concurrency=JOB_CONCURRENCY):
+        super().__init__(name="job-worker", daemon=True)
+        self.concurrency = concurrency
+        self.loop = None
+        self.stop_event = None
+        self.started_loop = threading.Event()
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        self.started_loop.set()
+        await run_worker(concurrency=self.concurrency, stop=self.stop_event)
+
+    def stop(self, timeout=10):
+        if self.started_loop.wait(timeout) and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        self.join(timeout)
@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import subprocess
+from glob import glob
+from tempfile import TemporaryDirectory
+from google.genai import types
+
+# Replace answer videos with a mono audio track plus a few keyframes before sending them to Gemini
+MEDIA_SLIMMING = os.getenv("MEDIA_SLIMMING", "false").lower() == "true"
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+MEDIA_SLIM_KEYFRAMES = int(os.getenv("MEDIA_SLIM_KEYFRAMES", 4))
+MEDIA_SLIM_FRAME_WIDTH = int(os.getenv("MEDIA_SLIM_FRAME_WIDTH", 320))
+MEDIA_SLIM_AUDIO_BITRATE = os.getenv("MEDIA_SLIM_AUDIO_BITRATE", "24k")
+MEDIA_SLIM_TIMEOUT_S = float(os.getenv("MEDIA_SLIM_TIMEOUT_S", 60))
+# Frame spacing used when the container does not report a duration
+DEFAULT_FRAME_INTERVAL_S = 5
+
+SLIM_PROMPT_PREFIX = """The student's answer video has been reduced to its audio track followed by a few still frames taken across the answer.
+Use the audio for the transcript and the frames for facial expression and confidence.
+"""
+
+
+def slimming_enabled():
+    return MEDIA_SLIMMING and shutil.which(FFMPEG_BINARY) is not None
+
+
+def _duration(path):
+    if not shutil.which(FFPROBE_BINARY):
+        return None
+    try:
+        result = subprocess.run(
+            [FFPROBE_BINARY, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=15
+        )
+        return float(result.stdout.strip())
+    except (ValueError, subprocess.SubprocessError):
+        # Browser-recorded webm often carries no duration
+        return None
+
+
+def source_path(video, workdir):
+    """
+    A filesystem path ffmpeg can read: the file itself when the buffer is a
+    real file, otherwise a copy in `workdir`.
+    """
+    name = getattr(video, "name", None)
+    if isinstance(name, str) and os.path.exists(name):
+        return name
+    path = os.path.join(workdir, "source")
+    video.seek(0)
+    with open(path, "wb") as source:
+        shutil.copyfileobj(video, source)
+    video.seek(0)
+    return path
+
+
+def slim_video(video):
+    """
+    Extracts a compressed mono audio track and MEDIA_SLIM_KEYFRAMES downscaled
+    JPEG frames from a video buffer with ffmpeg. Returns the Gemini parts
+    (audio first, then frames), or None if ffmpeg is unavailable or fails, in
+    which case the caller sends the original video.
+    """
+    if not slimming_enabled():
+        return None
+    started = time.monotonic()
+    try:
+        with TemporaryDirectory(prefix="slim_") as workdir:
+            source = source_path(video, workdir)
+            audio_path = os.path.join(workdir, "audio.ogg")
+            duration = _duration(source)
+            interval = max(1.0, duration / MEDIA_SLIM_KEYFRAMES) if duration else DEFAULT_FRAME_INTERVAL_S
+
+            subprocess.run(
+                [
+                    FFMPEG_BINARY, "-v", "error", "-y", "-i", source,
+                    # Mono 16 kHz Opus: plenty for speech
+                    "-map", "0:a:0", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", MEDIA_SLIM_AUDIO_BITRATE, audio_path,
+                    "-map", "0:v:0", "-vf", f"fps=1/{interval:g},scale={MEDIA_SLIM_FRAME_WIDTH}:-2",
+                    "-frames:v", str(MEDIA_SLIM_KEYFRAMES), "-q:v", "5", os.path.join(workdir, "frame_%02d.jpg")
+                ],
+                check=True, capture_output=True, timeout=MEDIA_SLIM_TIMEOUT_S
+            )
+
+            with open(audio_path, "rb") as audio:
+                parts = [types.Part.from_bytes(data=audio.read(), mime_type="audio/ogg")]
+            for frame_path in sorted(glob(os.path.join(workdir, "frame_*.jpg"))):
+                with open(frame_path, "rb") as frame:
+                    parts.append(types.Part.from_bytes(data=frame.read(), mime_type="image/jpeg"))
+    except (OSError, subprocess.SubprocessError) as e:
+        detail = getattr(e, "stderr", None)
+        print(f"Warning: Media slimming failed, sending original video: {detail.decode(errors='ignore').strip() if detail else e}")
+        return None
+
+    video.seek(0, os.SEEK_END)
+    original = video.tell()
+    video.seek(0)
+    slim = sum(len(part.inline_data.data) for part in parts)
+    print(f"[slim] {original} → {slim} bytes ({len(parts) - 1} frames) in {time.monotonic() - started:.1f}s")
+    return parts
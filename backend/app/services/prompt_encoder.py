@@ -0,0 +1,118 @@
+import os
+import json
+import math
+
+# Approximate characters per token for Gemini models on English text
+CHARS_PER_TOKEN = 4
+
+# Prompt token budgets per AI function. Encoded tables are shrunk to fit.
+TOKEN_BUDGETS = {
+    "analyze_test_results": 3000,
+    "generate_overall_video_evaluation": 6000,
+    "write_skill_gap_reasoning": 2500,
+    "evaluate_video_answers_batch": 8000,
+}
+TOKEN_BUDGETS.update(json.loads(os.getenv("AI_TOKEN_BUDGETS", "{}")))
+
+# Shortest a text cell gets truncated to when fitting a budget
+MIN_CELL_CHARS = 60
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def estimate_contents_tokens(contents):
+    """
+    Estimates the text tokens of generate_content contents. Non-text parts
+    (uploaded files, media bytes) are not counted.
+    """
+    if isinstance(contents, str):
+        return estimate_tokens(contents)
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_contents_tokens(part) for part in contents)
+    return 0
+
+
+def _lookup(row, path):
+    value = row
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _cell(value, max_chars=None):
+    if value is None:
+        text = ""
+    elif isinstance(value, bool):
+        text = "Y" if value else "N"
+    elif isinstance(value, float):
+        text = f"{value:g}"
+    elif isinstance(value, (list, tuple)):
+        text = "; ".join(_cell(v) for v in value)
+    elif isinstance(value, dict):
+        text = json.dumps(value, separators=(",", ":"), default=str)
+    else:
+        text = str(value)
+    # Collapse whitespace/newlines and keep the column separator unambiguous
+    text = " ".join(text.split()).replace("|", "/")
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars - 1].rstrip() + "…"
+    return text
+
+
+def _render(rows, fields, max_chars):
+    labels = [field.split(".")[-1] for field in fields]
+    columns = [[_cell(_lookup(row, field), max_chars) for row in rows] for field in fields]
+
+    # Hoist columns that hold the same value on every row into a single line
+    constant = {}
+    if len(rows) > 1:
+        for label, column in zip(labels, columns):
+            if all(value == column[0] for value in column):
+                constant[label] = column[0]
+
+    lines = []
+    if constant:
+        lines.append("All rows: " + ", ".join(f"{label}={value}" for label, value in constant.items()))
+    varying = [i for i, label in enumerate(labels) if label not in constant]
+    if varying:
+        lines.append("|".join(labels[i] for i in varying))
+        for r in range(len(rows)):
+            lines.append("|".join(columns[i][r] for i in varying))
+    return "\n".join(lines)
+
+
+def encode_table(rows, fields, token_budget=None):
+    """
+    Encodes a list of dicts as a compact pipe-separated table.
+
+    Only the listed `fields` are kept (dotted paths such as "analysis.technicalScore"
+    reach into nested objects), whitespace is collapsed, booleans become Y/N and
+    columns that repeat one value on every row are emitted once. When a
+    `token_budget` is given, the longest text cells are truncated until the
+    table fits.
+    """
+    rows = rows or []
+    text = _render(rows, fields, None)
+    if not token_budget or estimate_tokens(text) <= token_budget:
+        return text
+
+    longest = max((len(_cell(_lookup(row, field))) for row in rows for field in fields), default=0)
+    max_chars = longest
+    while max_chars > MIN_CELL_CHARS:
+        max_chars = max(MIN_CELL_CHARS, max_chars // 2)
+        text = _render(rows, fields, max_chars)
+        if estimate_tokens(text) <= token_budget:
+            break
+    return text
+
+
+def budget_for(name, share=1.0):
+    """
+    Token budget available to one encoded section of `name`'s prompt.
+    """
+    budget = TOKEN_BUDGETS.get(name)
+    return int(budget * share) if budget else None
@@ -0,0 +1,68 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+from tempfile import TemporaryDirectory
+from app.services.media_slimming import FFMPEG_BINARY, source_path
+
+# Check answer videos for speech locally before any Gemini call
+SILENCE_DETECTION = os.getenv("SILENCE_DETECTION", "true").lower() == "true"
+# Loudest half-second window must reach this level (dBFS) to count as speech
+SILENCE_THRESHOLD_DB = float(os.getenv("SILENCE_THRESHOLD_DB", -45))
+# Files smaller than this cannot hold a spoken answer
+EMPTY_VIDEO_BYTES = int(os.getenv("EMPTY_VIDEO_BYTES", 2048))
+SILENCE_TIMEOUT_S = float(os.getenv("SILENCE_TIMEOUT_S", 30))
+
+SAMPLE_RATE = 8000
+WINDOW = SAMPLE_RATE // 2
+
+
+def peak_level_db(pcm):
+    """
+    Loudest windowed RMS level (dBFS) of signed 16-bit mono PCM.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    if samples.size == 0:
+        return float("-inf")
+    padded = np.pad(samples, (0, -samples.size % WINDOW))
+    rms = np.sqrt(np.mean(padded.reshape(-1, WINDOW) ** 2, axis=1))
+    peak = float(rms.max())
+    return 20 * np.log10(peak) if peak > 0 else float("-inf")
+
+
+def is_silent(video):
+    """
+    True when a video buffer is empty, has no audio track or never rises above
+    SILENCE_THRESHOLD_DB. False when speech may be present or the check cannot
+    run (no ffmpeg, decode error), so unclear cases still go to Gemini.
+    """
+    if not SILENCE_DETECTION:
+        return False
+    size = video.seek(0, os.SEEK_END)
+    video.seek(0)
+    if size < EMPTY_VIDEO_BYTES:
+        return True
+    if not shutil.which(FFMPEG_BINARY):
+        return False
+
+    try:
+        with TemporaryDirectory(prefix="silence_") as workdir:
+            source = source_path(video, workdir)
+            probe = subprocess.run(
+                [FFMPEG_BINARY, "-v", "error", "-i", source, "-map", "0:a:0?", "-vn",
+                 "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+                capture_output=True, timeout=SILENCE_TIMEOUT_S, check=True
+            )
+    except subprocess.CalledProcessError as e:
+        if b"does not contain any stream" in (e.stderr or b""):
+            print("[silence] video has no audio track")
+            return True
+        print(f"Warning: Silence check failed, sending video to Gemini: {e}")
+        return False
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Warning: Silence check failed, sending video to Gemini: {e}")
+        return False
+
+    level = peak_level_db(probe.stdout)
+    print(f"[silence] peak level {level:.1f} dBFS (threshold {SILENCE_THRESHOLD_DB} dBFS)")
+    return level < SILENCE_THRESHOLD_DB
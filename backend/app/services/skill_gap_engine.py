@@ -0,0 +1,133 @@
+import numpy as np
+
+GENERAL_SKILL = "General"
+
+
+def _resolve_skill(related_skill, question_text, required_skills):
+    """
+    Maps an untagged ("General") question onto a required skill whose name
+    appears in the question text, so its result still counts towards that skill.
+    """
+    if related_skill and related_skill != GENERAL_SKILL:
+        return related_skill
+    text = (question_text or "").lower()
+    for skill in required_skills:
+        if skill and skill.lower() in text:
+            return skill
+    return GENERAL_SKILL
+
+
+def _as_score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def compute_skill_scores(mcq_answers, video_answers, required_skills, mcq_weight=40, video_weight=60):
+    """
+    Computes per-skill theory (MCQ) and application (video) proficiency on a 0-10 scale.
+
+    Theory is the share of correct MCQs for the skill; application is the mean
+    video technicalScore, leaving out answers whose evaluation failed (their
+    placeholder zeros say nothing about the student). The combined score weights the two by the system
+    mcq/video weightages, using whichever side is available when only one is.
+
+    :return: List of dicts with skillName, theoryScore, applicationScore, score,
+             mcqCorrect, mcqTotal and videoCount, in first-seen skill order.
+    """
+    skills = []
+    index = {}
+
+    def skill_id(name):
+        if name not in index:
+            index[name] = len(skills)
+            skills.append(name)
+        return index[name]
+
+    video_answers = [a for a in video_answers if not (a.get("analysis") or {}).get("evaluationFailed")]
+    mcq_ids = [skill_id(_resolve_skill(a.get("relatedSkill"), a.get("question"), required_skills)) for a in mcq_answers]
+    mcq_correct = [1.0 if a.get("isCorrect") else 0.0 for a in mcq_answers]
+    video_ids = [skill_id(_resolve_skill(a.get("relatedSkill"), a.get("question"), required_skills)) for a in video_answers]
+    video_scores = [_as_score((a.get("analysis") or {}).get("technicalScore", 0)) for a in video_answers]
+
+    n = len(skills)
+    if n == 0:
+        return []
+
+    mcq_total = np.bincount(np.asarray(mcq_ids, dtype=np.int64), minlength=n).astype(float)
+    mcq_hits = np.bincount(np.asarray(mcq_ids, dtype=np.int64), weights=np.asarray(mcq_correct, dtype=float), minlength=n)
+    video_total = np.bincount(np.asarray(video_ids, dtype=np.int64), minlength=n).astype(float)
+    video_sum = np.bincount(np.asarray(video_ids, dtype=np.int64), weights=np.asarray(video_scores, dtype=float), minlength=n)
+
+    has_theory = mcq_total > 0
+    has_application = video_total > 0
+    theory = np.divide(mcq_hits * 10.0, mcq_total, out=np.zeros(n), where=has_theory)
+    application = np.divide(video_sum, video_total, out=np.zeros(n), where=has_application)
+
+    w_theory = np.where(has_theory, float(mcq_weight), 0.0)
+    w_application = np.where(has_application, float(video_weight), 0.0)
+    weight_sum = w_theory + w_application
+    combined = np.divide(theory * w_theory + application * w_application, weight_sum,
+                         out=np.zeros(n), where=weight_sum > 0)
+
+    return [
+        {
+            "skillName": skills[i],
+            "theoryScore": round(float(theory[i]), 2) if has_theory[i] else None,
+            "applicationScore": round(float(application[i]), 2) if has_application[i] else None,
+            "score": round(float(combined[i]), 2),
+            "mcqCorrect": int(mcq_hits[i]),
+            "mcqTotal": int(mcq_total[i]),
+            "videoCount": int(video_total[i])
+        }
+        for i in range(n)
+    ]
+
+
+def describe_skill(row, threshold):
+    """
+    Deterministic reasoning text for one scored skill.
+    """
+    parts = []
+    if row["mcqTotal"]:
+        parts.append(f"answered {row['mcqCorrect']} of {row['mcqTotal']} MCQs correctly (theory {row['theoryScore']}/10)")
+    if row["videoCount"]:
+        parts.append(f"averaged {row['applicationScore']}/10 technical score across {row['videoCount']} video answer(s) (application)")
+    evidence = " and ".join(parts) if parts else "has no assessment evidence"
+    verdict = "below" if row["score"] < threshold else "at or above"
+    return f"Student {evidence}, giving a consolidated score of {row['score']}/10, {verdict} the {threshold} threshold."
+
+
+def discover_skill_gaps(mcq_answers, video_answers, course_details, threshold=6.5, mcq_weight=40, video_weight=60):
+    """
+    Local replacement for the LLM gap discovery: scores every skill, flags those
+    under `threshold` and returns the existing detailedSkillGap structure.
+
+    Required course skills are grouped under the course category; anything else
+    (including untagged "General" questions) under "Additional Topics".
+    Returns [] when no skill is a gap.
+    """
+    required_skills = course_details.get("skills_required", []) or []
+    rows = compute_skill_scores(mcq_answers or [], video_answers or [], required_skills, mcq_weight, video_weight)
+
+    core_category = course_details.get("category") or "Core Skills"
+    categories = {}
+    any_gap = False
+    for row in rows:
+        is_gap = row["score"] < threshold
+        any_gap = any_gap or (is_gap and row["skillName"] != GENERAL_SKILL)
+        category = core_category if row["skillName"] in required_skills else "Additional Topics"
+        categories.setdefault(category, []).append({
+            "skillName": row["skillName"],
+            "score": row["score"],
+            "threshold": threshold,
+            "isGap": is_gap,
+            "theoryScore": row["theoryScore"],
+            "applicationScore": row["applicationScore"],
+            "reasoning": describe_skill(row, threshold)
+        })
+
+    if not any_gap:
+        return []
+    return [{"category": name, "skills": skills} for name, skills in categories.items()]
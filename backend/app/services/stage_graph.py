@@ -0,0 +1,132 @@
+import time
+import asyncio
+from datetime import datetime
+
+DONE = "done"
+FAILED = "failed"
+PROVIDED = "provided"
+
+
+class Stage:
+    """
+    One step of a StageGraph. `run(outputs)` is async and receives the graph
+    inputs plus the output of every stage it runs `after`, keyed by name.
+    Outputs of `persist` stages are kept in the stage record so a later run
+    can resume past them.
+    """
+    def __init__(self, name, run, after=(), persist=True):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.persist = persist
+
+
+class StageGraph:
+    def __init__(self, stages):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dependency in stage.after:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        order, visiting = [], set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage graph has a cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def downstream(self, name):
+        """
+        `name` and every stage that depends on it, directly or not.
+        """
+        if name not in self.stages:
+            raise ValueError(f"Unknown stage '{name}'; expected one of: {', '.join(self.order)}")
+        found = {name}
+        for stage_name in self.order:
+            if any(dependency in found for dependency in self.stages[stage_name].after):
+                found.add(stage_name)
+        return found
+
+    async def run(self, inputs, saved=None, from_stage=None, provided=None, on_record=None):
+        """
+        Runs each stage as soon as its dependencies finish, so independent
+        stages run concurrently. Returns {name: output} (inputs included).
+
+        - `provided`: outputs computed elsewhere; those stages are not run.
+        - `from_stage`: only that stage and its downstream stages run; earlier
+          persisted stages reuse their output from `saved` (stage records of a
+          previous run). Raises ValueError if one has no saved output.
+        - `on_record(name, record)`: called as each stage finishes or fails,
+          with its status, start time, duration and (persisted) output.
+        """
+        outputs = dict(inputs)
+        saved = saved or {}
+        provided = provided or {}
+        rerun = self.downstream(from_stage) if from_stage else set(self.order)
+        for name in set(self.order) - rerun:
+            stage = self.stages[name]
+            if name not in provided and stage.persist and "output" not in saved.get(name, {}):
+                raise ValueError(f"Cannot resume from '{from_stage}': stage '{name}' has no saved output")
+
+        def record(name, entry):
+            if on_record:
+                try:
+                    on_record(name, entry)
+                except Exception as e:
+                    print(f"Warning: Failed to record pipeline stage {name}: {e}")
+
+        async def execute(stage):
+            await asyncio.gather(*(tasks[dependency] for dependency in stage.after))
+            if stage.name in provided:
+                outputs[stage.name] = provided[stage.name]
+                record(stage.name, {"status": PROVIDED, "startedAt": datetime.utcnow(), "output": provided[stage.name]})
+                return
+            if stage.name not in rerun and stage.persist:
+                outputs[stage.name] = saved[stage.name]["output"]
+                print(f"[pipeline] {stage.name}: reusing saved output")
+                return
+
+            started_at = datetime.utcnow()
+            started = time.monotonic()
+            try:
+                output = await stage.run(outputs)
+            except Exception as e:
+                record(stage.name, {
+                    "status": FAILED,
+                    "startedAt": started_at,
+                    "durationMs": round((time.monotonic() - started) * 1000),
+                    "error": str(e)[:1000]
+                })
+                raise
+            duration = time.monotonic() - started
+            outputs[stage.name] = output
+            print(f"[pipeline] {stage.name}: done in {duration:.2f}s")
+            entry = {"status": DONE, "startedAt": started_at, "durationMs": round(duration * 1000)}
+            if stage.persist:
+                entry["output"] = output
+            record(stage.name, entry)
+
+        tasks = {}
+        for name in self.order:
+            tasks[name] = asyncio.ensure_future(execute(self.stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return outputs
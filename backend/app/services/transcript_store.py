@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.database.connection import transcripts_collection, transcript_cache_collection
+
+DONE = "done"
+FAILED = "failed"
+
+# How long a transcript stays reusable for identical video bytes
+TRANSCRIPT_CACHE_TTL_DAYS = int(os.getenv("TRANSCRIPT_CACHE_TTL_DAYS", 90))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_indexes_ready = False
+_cache_indexes_ready = False
+_cache_lock = threading.Lock()
+_cache_counts = {"hits": 0, "misses": 0, "stores": 0}
+
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        transcripts_collection.create_index(
+            [("studentId", 1), ("courseId", 1), ("questionId", 1), ("videoUrl", 1)],
+            unique=True
+        )
+        _indexes_ready = True
+
+
+def load_checkpoints(student_id, course_id, video_urls):
+    """
+    Returns {questionId: transcript entry} for questions of this submission
+    already transcribed successfully. Entries are matched on the video URL, so
+    a re-recorded answer (new Cloudinary version) is transcribed again.
+    """
+    _ensure_indexes()
+    wanted = {(item.get("question"), item.get("url")) for item in video_urls}
+    checkpoints = {}
+    for record in transcripts_collection.find({
+        "studentId": ObjectId(student_id),
+        "courseId": ObjectId(course_id),
+        "status": DONE
+    }):
+        if (record["questionId"], record["videoUrl"]) in wanted:
+            checkpoints[record["questionId"]] = record["entry"]
+    return checkpoints
+
+
+def save_checkpoint(student_id, course_id, entry, status):
+    """
+    Records the outcome of one question as soon as it is known.
+    """
+    try:
+        _ensure_indexes()
+        transcripts_collection.update_one(
+            {
+                "studentId": ObjectId(student_id),
+                "courseId": ObjectId(course_id),
+                "questionId": entry.get("questionId"),
+                "videoUrl": entry.get("videoUrl")
+            },
+            {"$set": {"status": status, "entry": entry, "updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Warning: Failed to checkpoint transcript for {entry.get('questionId')}: {e}")
+
+
+def clear_checkpoints(student_id, course_id):
+    result = transcripts_collection.delete_many({
+        "studentId": ObjectId(student_id),
+        "courseId": ObjectId(course_id)
+    })
+    return result.deleted_count
+
+
+def hash_video(content):
+    """
+    SHA-256 of a video given as bytes or a seekable file (read from the start
+    and rewound).
+    """
+    if isinstance(content, (bytes, bytearray)):
+        return hashlib.sha256(content).hexdigest()
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def _cache_id(content_hash, model):
+    return f"{model}:{content_hash}"
+
+
+def _count(key):
+    with _cache_lock:
+        _cache_counts[key] += 1
+
+
+def cached_transcript(content_hash, model):
+    """
+    Returns the cached {transcript, facialExpression, confidenceScore} for
+    these video bytes, or None.
+    """
+    try:
+        record = transcript_cache_collection.find_one({"_id": _cache_id(content_hash, model)})
+    except Exception as e:
+        print(f"Warning: Transcript cache lookup failed: {e}")
+        record = None
+    _count("hits" if record else "misses")
+    if not record:
+        return None
+    return {key: record[key] for key in ("transcript", "facialExpression", "confidenceScore")}
+
+
+def store_transcript(content_hash, model, result):
+    global _cache_indexes_ready
+    try:
+        if not _cache_indexes_ready:
+            transcript_cache_collection.create_index("expiresAt", expireAfterSeconds=0)
+            _cache_indexes_ready = True
+        now = datetime.utcnow()
+        transcript_cache_collection.update_one(
+            {"_id": _cache_id(content_hash, model)},
+            {"$set": {
+                "transcript": result["transcript"],
+                "facialExpression": result["facialExpression"],
+                "confidenceScore": result["confidenceScore"],
+                "model": model,
+                "createdAt": now,
+                "expiresAt": now + timedelta(days=TRANSCRIPT_CACHE_TTL_DAYS)
+            }},
+            upsert=True
+        )
+        _count("stores")
+    except Exception as e:
+        print(f"Warning: Failed to cache transcript: {e}")
+
+
+def cache_stats():
+    with _cache_lock:
+        lookups = _cache_counts["hits"] + _cache_counts["misses"]
+        return {
+            **_cache_counts,
+            "hitRatio": round(_cache_counts["hits"] / lookups, 3) if lookups else 0
+        }
@@ -1,128 +1,423 @@
 import os
+import io
+import time
+import shutil
+import mimetypes
+import tempfile
+import asyncio
 import requests
 from app.database.connection import responses_collection
 from bson import ObjectId
-from tempfile import NamedTemporaryFile
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
+from app.services.ai_gateway import AIRequest, BACKGROUND, get_async_client, arun
+from app.services.ai_service import assess_video_answer_async
+from app.services.ai_circuit_breaker import breaker, CircuitOpenError
+from app.services.ai_telemetry import telemetry
+from app.services.file_state_poller import wait_until_active
+from app.services import transcript_store
+from app.services.media_slimming import slim_video, slimming_enabled, SLIM_PROMPT_PREFIX
+from app.services.silence_detection import is_silent
+from app.services import stage_graph
+from app.schemas.ai import VideoTranscription, VideoAnswerEvaluation
 
 load_dotenv()
 
-# Initialize Gemini Client
 GEMINI_MODEL = os.getenv("GEMINI_MODEL")
-client = genai.Client()
+# Deadlines (seconds) for the slow per-video steps
+VIDEO_DOWNLOAD_TIMEOUT_S = float(os.getenv("VIDEO_DOWNLOAD_TIMEOUT_S", 60))
+GEMINI_UPLOAD_TIMEOUT_S = float(os.getenv("GEMINI_UPLOAD_TIMEOUT_S", 120))
+AI_TRANSCRIBE_TIMEOUT_S = float(os.getenv("AI_TRANSCRIBE_TIMEOUT_S", 180))
 
-def transcribe_videos(student_id: str, course_id: str, video_urls: list):
-    """
-    Background task to transcribe videos using Gemini API and update the database.
-    """
-    transcripts = []
-    
-    for item in video_urls:
-        question_id = item.get("question")
-        video_url = item.get("url")
-        
-        temp_video_path = None
-        uploaded_file = None
-        
-        try:
-            print(f"Processing transcript for {question_id} using Gemini API...")
-            
-            # Step 1: Fetch Video URL from Cloudinary to a temporary file
-            response = requests.get(video_url, stream=True)
-            response.raise_for_status()
-            
-            with NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video:
-                for chunk in response.iter_content(chunk_size=8192):
-                    temp_video.write(chunk)
-                temp_video_path = temp_video.name
-            
-            # Step 2: Upload temporary file to Gemini
-            print(f"Uploading {question_id} to Gemini...")
-            uploaded_file = client.files.upload(file=temp_video_path)
-            
-            # Wait for video processing to complete (required for video files on Gemini)
-            import time
-            while uploaded_file.state.name == "PROCESSING":
-                print(".", end="", flush=True)
-                time.sleep(2)
-                uploaded_file = client.files.get(name=uploaded_file.name)
-            print() # Print new line after dots
-            
-            if uploaded_file.state.name == "FAILED":
-                raise Exception("Gemini failed to process the uploaded video file.")
-            
-            # Step 3: Ask Gemini to Transcribe
-            print(f"Generating transcript for {question_id}...")
-            prompt = """Please provide a highly accurate, word-for-word transcript of the speech in this video. Do not include any other commentary, stage directions, or text other than the spoken words.
+# Worker limits per pipeline stage (per submission)
+TRANSCRIBE_DOWNLOAD_WORKERS = int(os.getenv("TRANSCRIBE_DOWNLOAD_WORKERS", 4))
+TRANSCRIBE_UPLOAD_WORKERS = int(os.getenv("TRANSCRIBE_UPLOAD_WORKERS", 3))
+TRANSCRIBE_GENERATE_WORKERS = int(os.getenv("TRANSCRIBE_GENERATE_WORKERS", 3))
+TRANSCRIBE_SLIM_WORKERS = int(os.getenv("TRANSCRIBE_SLIM_WORKERS", 2))
+# ffmpeg silence checks (one decode each) running at once per job
+TRANSCRIBE_PROBE_WORKERS = int(os.getenv("TRANSCRIBE_PROBE_WORKERS", 2))
+
+# Videos are buffered in memory up to this size, then spill to a temp file
+VIDEO_SPOOL_MAX_MEMORY = int(os.getenv("VIDEO_SPOOL_MAX_MEMORY", 32 * 1024 * 1024))
+VIDEO_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Videos up to this size are sent inline with the generate call instead of via the Files API
+INLINE_VIDEO_MAX_BYTES = int(os.getenv("INLINE_VIDEO_MAX_BYTES", 8 * 1024 * 1024))
+
+# Evaluate each answer as soon as its transcript is ready (per-answer evaluation mode only)
+STREAMING_EVALUATION = os.getenv("STREAMING_EVALUATION", "true").lower() == "true"
+
+# Where submit_video_test leaves a local copy of each upload for the transcription job
+VIDEO_SPOOL_DIR = os.getenv("VIDEO_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "video_spool"))
+# Spooled copies older than this are swept even if no job consumed them
+VIDEO_SPOOL_MAX_AGE_S = int(os.getenv("VIDEO_SPOOL_MAX_AGE_S", 24 * 3600))
+
+# Shared keep-alive session for Cloudinary downloads
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=TRANSCRIBE_DOWNLOAD_WORKERS * 2))
+
+TRANSCRIBE_MODEL = "gemini-2.5-flash"
+
+EMPTY_TRANSCRIPT = "[Audio was empty or indiscernible]"
+# Stored for answers the local silence check rejects; evaluation skips Gemini for these too
+SILENT_ANSWER = {
+    "transcript": EMPTY_TRANSCRIPT,
+    "facialExpression": "Not detected",
+    "confidenceScore": 0,
+    "silent": True
+}
+
+TRANSCRIPTION_PROMPT = """Please provide a highly accurate, word-for-word transcript of the speech in this video. Do not include any other commentary, stage directions, or text other than the spoken words.
             Additionally, analyze the facial expressions and confidence of the student.
             Return a JSON object with the following keys:
             - "transcript": The word-for-word transcript. If audio is empty, put "[Audio was empty or indiscernible]".
             - "facialExpression": A short description recognizing the main facial expression (e.g. "Neutral", "Smiling", "Nervous").
             - "confidenceScore": A number out of 10 representing the student's confidence."""
-            
-            gemini_response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[
-                    uploaded_file,
-                    prompt
-                ],
-                config={"response_mime_type": "application/json"}
-            )
-            
-            import json
+
+
+def _download_video(video_url):
+    """
+    Streams a video from Cloudinary into a spooled buffer (memory first, disk
+    only past VIDEO_SPOOL_MAX_MEMORY). Returns the rewound buffer and its mime type.
+    """
+    buffer = SpooledTemporaryFile(max_size=VIDEO_SPOOL_MAX_MEMORY)
+    try:
+        with _http.get(video_url, stream=True, timeout=VIDEO_DOWNLOAD_TIMEOUT_S) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=VIDEO_DOWNLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+            mime_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        buffer.seek(0)
+    except Exception:
+        buffer.close()
+        raise
+    return buffer, mime_type if mime_type.startswith("video/") else "video/mp4"
+
+
+def spool_video(content, student_id, question_id, filename):
+    """
+    Writes an uploaded video (bytes or a file, copied in chunks from the start
+    and rewound) to VIDEO_SPOOL_DIR so a transcription job on this machine
+    can read it instead of downloading it back from Cloudinary.
+    Returns the spool path, or None if it could not be written.
+    """
+    extension = os.path.splitext(filename or "")[1] or ".mp4"
+    path = os.path.join(VIDEO_SPOOL_DIR, f"{student_id}_{question_id}{extension}")
+    try:
+        os.makedirs(VIDEO_SPOOL_DIR, exist_ok=True)
+        with open(path, "wb") as spool:
+            if isinstance(content, (bytes, bytearray)):
+                spool.write(content)
+            else:
+                content.seek(0)
+                shutil.copyfileobj(content, spool, VIDEO_DOWNLOAD_CHUNK_SIZE)
+                content.seek(0)
+        return path
+    except Exception as e:
+        print(f"Warning: Failed to spool video {question_id}: {e}")
+        return None
+
+
+def _open_local_video(source):
+    """
+    Opens a handed-off video (raw bytes or a spool path). Returns (buffer,
+    mime_type), or None when the video is not available on this machine.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source), "video/mp4"
+    if isinstance(source, str) and os.path.exists(source):
+        mime_type = mimetypes.guess_type(source)[0] or ""
+        return open(source, "rb"), mime_type if mime_type.startswith("video/") else "video/mp4"
+    return None
+
+
+def discard_local_videos(local_videos):
+    for source in (local_videos or {}).values():
+        if isinstance(source, str) and os.path.exists(source):
             try:
-                result_json = json.loads(gemini_response.text.strip())
-                transcript_text = result_json.get("transcript", "[Audio was empty or indiscernible]")
-                facial_expression = result_json.get("facialExpression", "Neutral")
-                confidence_score = result_json.get("confidenceScore", 5)
-            except Exception as parse_e:
-                print("Failed to parse gemini JSON:", parse_e)
-                transcript_text = gemini_response.text.strip()
-                facial_expression = "Neutral"
-                confidence_score = 5
-            if not transcript_text:
-                 transcript_text = "[Audio was empty or indiscernible]"
-                 
-            # Step 4: Map Transcript with Question
-            transcripts.append({
-                "questionId": question_id,
-                "videoUrl": video_url,
-                "transcript": transcript_text,
-                "facialExpression": facial_expression,
-                "confidenceScore": confidence_score
-            })
-            print(f"Successfully transcribed {question_id}")
-            
-        except requests.exceptions.RequestException as req_err:
-             print(f"Failed to download video {question_id}: {req_err}")
-             transcripts.append({
-                "questionId": question_id,
-                "videoUrl": video_url,
-                "transcript": f"Transcription failed (Download Error): {str(req_err)}"
-            })
-        except Exception as e:
-             print(f"Error processing {question_id}: {str(e)}")
-             transcripts.append({
-                "questionId": question_id,
-                "videoUrl": video_url,
-                "transcript": f"Transcription failed (API Error): {str(e)}"
-             })
-        finally:
-            # Cleanup local temporary file
-            if temp_video_path and os.path.exists(temp_video_path):
-                try: 
-                    os.remove(temp_video_path)
-                except Exception as e: 
-                    print(f"Warning: Failed to delete temp file {temp_video_path}: {e}")
-                    
-            # Cleanup uploaded file from Google's servers
-            if uploaded_file:
+                os.remove(source)
+            except Exception as e:
+                print(f"Warning: Failed to delete spooled video {source}: {e}")
+
+
+def sweep_spooled_videos(max_age_s=VIDEO_SPOOL_MAX_AGE_S):
+    """
+    Deletes spooled videos older than `max_age_s` (left behind by jobs that
+    ran elsewhere or never ran). Returns how many were removed.
+    """
+    if not os.path.isdir(VIDEO_SPOOL_DIR):
+        return 0
+    cutoff = time.time() - max_age_s
+    removed = 0
+    for entry in os.scandir(VIDEO_SPOOL_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError as e:
+            print(f"Warning: Failed to delete spooled video {entry.path}: {e}")
+    if removed:
+        print(f"Swept {removed} stale spooled videos")
+    return removed
+
+
+async def _generate_transcript(media, stages, question_id, assessment=None, prompt_prefix=""):
+    """
+    With an `assessment` (fused mode) the answer is transcribed and evaluated
+    in one call; if that call fails, only the transcript is requested.
+    """
+    async with stages["transcribe"]:
+        if assessment:
+            print(f"Transcribing and evaluating {question_id}...")
+            try:
+                return await assess_video_answer_async(
+                    media, assessment["question"], assessment["course"], prompt_prefix, AI_TRANSCRIBE_TIMEOUT_S
+                )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                print(f"[transcribe] {question_id}: fused call failed, transcribing only: {e}")
+        print(f"Generating transcript for {question_id}...")
+        return await arun(AIRequest(
+            "transcribe_video",
+            [*media, prompt_prefix + TRANSCRIPTION_PROMPT],
+            model=TRANSCRIBE_MODEL,
+            schema=VideoTranscription,
+            priority=BACKGROUND,
+            timeout=AI_TRANSCRIBE_TIMEOUT_S
+        ))
+
+
+async def _transcribe_one(item, stages, local_video=None, assessment=None, force=False):
+    """
+    Runs one answer video through download → upload → ready → transcribe.
+    Each stage holds its own semaphore, so different videos overlap in
+    different stages. Videos up to INLINE_VIDEO_MAX_BYTES skip upload and
+    ready and are sent inline with the transcription request. The download is
+    skipped when `local_video` (bytes or a spool path) is available here.
+    Identical video bytes transcribed before (same SHA-256) are answered from
+    the transcript cache without calling Gemini; the hash comes from the
+    submission ("contentHash") or is computed before upload. With
+    MEDIA_SLIMMING on, Gemini first gets only an audio track and keyframes;
+    the original video is sent if slimming or that call fails. Videos the
+    local silence check rejects never reach Gemini. With an `assessment`
+    ({"question", "relatedSkill", "course"}, fused evaluation mode) the entry
+    also carries "relatedSkill" and "analysis" from the same call. `force`
+    skips the cache lookup (the fresh transcript still replaces the cached one).
+
+    Returns (transcript entry, checkpoint status). CircuitOpenError is
+    re-raised so the job can be retried once Gemini recovers.
+    """
+    question_id = item.get("question")
+    video_url = item.get("url")
+
+    video = None
+    uploaded_file = None
+
+    try:
+        print(f"Processing transcript for {question_id} using Gemini API...")
+        content_hash = item.get("contentHash")
+        cached = transcript_store.cached_transcript(content_hash, TRANSCRIBE_MODEL) if content_hash and not force else None
+
+        if not cached:
+            breaker.check()
+
+            # Stage 1: Use the handed-off copy, or stream the video from Cloudinary into a spooled buffer
+            local = _open_local_video(local_video)
+            if local:
+                video, mime_type = local
+            else:
+                async with stages["download"]:
+                    video, mime_type = await asyncio.to_thread(_download_video, video_url)
+
+            if not content_hash:
+                content_hash = await asyncio.to_thread(transcript_store.hash_video, video)
+                if not force:
+                    cached = transcript_store.cached_transcript(content_hash, TRANSCRIBE_MODEL)
+
+        if cached:
+            print(f"[transcribe] {question_id}: identical video transcribed before, using cached transcript")
+            return {"questionId": question_id, "videoUrl": video_url, **cached}, transcript_store.DONE
+
+        async with stages["probe"]:
+            silent = await asyncio.to_thread(is_silent, video)
+        if silent:
+            print(f"[transcribe] {question_id}: no speech detected, skipping Gemini")
+            return {"questionId": question_id, "videoUrl": video_url, **SILENT_ANSWER}, transcript_store.DONE
+
+        # Optional slimming: transcribe from audio + keyframes, keeping the original video as fallback
+        result_json = None
+        if slimming_enabled():
+            async with stages["slim"]:
+                slim_parts = await asyncio.to_thread(slim_video, video)
+            if slim_parts:
+                print(f"[transcribe] {question_id}: slim path (audio + {len(slim_parts) - 1} frames)")
                 try:
-                    client.files.delete(name=uploaded_file.name)
+                    result_json = await _generate_transcript(slim_parts, stages, question_id, assessment, SLIM_PROMPT_PREFIX)
+                except CircuitOpenError:
+                    raise
                 except Exception as e:
-                    print(f"Warning: Failed to delete file from Gemini API {uploaded_file.name}: {e}")
+                    print(f"[transcribe] {question_id}: slim transcription failed, falling back to the original video: {e}")
+
+        if result_json is None:
+            size = video.seek(0, os.SEEK_END)
+            video.seek(0)
+            if size <= INLINE_VIDEO_MAX_BYTES:
+                # Small clip: send the bytes inline, skipping upload, polling and delete
+                print(f"[transcribe] {question_id}: inline path ({size} bytes)")
+                media = types.Part.from_bytes(data=video.read(), mime_type=mime_type)
+                video.close()
+                video = None
+            else:
+                print(f"[transcribe] {question_id}: Files API path ({size} bytes)")
+                # Stage 2: Upload the buffer to Gemini
+                async with stages["upload"]:
+                    print(f"Uploading {question_id} to Gemini...")
+                    with telemetry.track("gemini_file_upload", "files"):
+                        uploaded_file = await get_async_client().files.upload(
+                            file=video,
+                            config={
+                                "mime_type": mime_type,
+                                "http_options": {"timeout": int(GEMINI_UPLOAD_TIMEOUT_S * 1000)}
+                            }
+                        )
+                    video.close()
+                    video = None
+
+                # Stage 3: Wait for video processing to complete (one shared poller for all files)
+                uploaded_file = await wait_until_active(uploaded_file)
+                media = uploaded_file
+
+            # Stage 4: Ask Gemini to Transcribe
+            result_json = await _generate_transcript([media], stages, question_id, assessment)
+
+        transcript_text = result_json["transcript"].strip()
+        facial_expression = result_json["facialExpression"] or "Neutral"
+        confidence_score = result_json["confidenceScore"]
+        if not transcript_text:
+            transcript_text = EMPTY_TRANSCRIPT
+
+        print(f"Successfully transcribed {question_id}")
+        result = {
+            "transcript": transcript_text,
+            "facialExpression": facial_expression,
+            "confidenceScore": confidence_score
+        }
+        transcript_store.store_transcript(content_hash, TRANSCRIBE_MODEL, result)
+        entry = {"questionId": question_id, "videoUrl": video_url, **result}
+        if "skill" in result_json:
+            entry["relatedSkill"] = assessment["relatedSkill"]
+            entry["analysis"] = {key: result_json[key] for key in VideoAnswerEvaluation.model_fields}
+        return entry, transcript_store.DONE
+
+    except CircuitOpenError:
+        raise
+    except requests.exceptions.RequestException as req_err:
+        print(f"Failed to download video {question_id}: {req_err}")
+        return {
+            "questionId": question_id,
+            "videoUrl": video_url,
+            "transcript": f"Transcription failed (Download Error): {str(req_err)}"
+        }, transcript_store.FAILED
+    except Exception as e:
+        print(f"Error processing {question_id}: {str(e)}")
+        return {
+            "questionId": question_id,
+            "videoUrl": video_url,
+            "transcript": f"Transcription failed (API Error): {str(e)}"
+        }, transcript_store.FAILED
+    finally:
+        # Release the local buffer (and its spill file, if any)
+        if video is not None:
+            video.close()
+
+        # Cleanup uploaded file from Google's servers
+        if uploaded_file:
+            try:
+                await get_async_client().files.delete(name=uploaded_file.name)
+            except Exception as e:
+                print(f"Warning: Failed to delete file from Gemini API {uploaded_file.name}: {e}")
+
+
+async def transcribe_videos(student_id: str, course_id: str, video_urls: list, local_videos: dict = None, force: bool = False):
+    """
+    Job handler that transcribes videos using Gemini API, updates the database
+    and runs the video analysis.
+
+    Videos are processed concurrently, bounded per stage by the
+    TRANSCRIBE_*_WORKERS limits; transcripts are stored in question order.
+    `local_videos` optionally maps question IDs to the submitted bytes or a
+    spool path; videos missing from it (or from this machine) are downloaded.
+
+    Each question is checkpointed as soon as it finishes. Questions already
+    transcribed for the same video URL are reused, so a rerun only redoes
+    missing or failed questions. `force` bypasses the transcript cache, so
+    every video without a checkpoint is sent to Gemini again.
+
+    With STREAMING_EVALUATION on and the course in per-answer evaluation mode,
+    each transcript goes straight to evaluation while other videos are still
+    being transcribed; skill gaps and the overall verdict run once every
+    answer is evaluated. In "fused" mode the transcription call evaluates the
+    answer too, and only answers it could not evaluate (cache hits, silent
+    videos, fused-call failures) are evaluated separately. The analysis
+    context is read once up front either way.
+    """
+    # Imported here: video_analysis imports this module
+    from app.services.video_analysis import (
+        load_analysis_context, map_answer_to_question, evaluate_one_video_answer,
+        process_video_test_analysis, EVALUATION_CONCURRENCY
+    )
+
+    stages = {
+        "download": asyncio.Semaphore(TRANSCRIBE_DOWNLOAD_WORKERS),
+        "upload": asyncio.Semaphore(TRANSCRIBE_UPLOAD_WORKERS),
+        "transcribe": asyncio.Semaphore(TRANSCRIBE_GENERATE_WORKERS),
+        "slim": asyncio.Semaphore(TRANSCRIBE_SLIM_WORKERS),
+        "probe": asyncio.Semaphore(TRANSCRIBE_PROBE_WORKERS)
+    }
+    checkpoints = transcript_store.load_checkpoints(student_id, course_id, video_urls)
+    context = load_analysis_context(student_id, course_id)
+    mode = context["evaluationMode"] if context else None
+    streaming = mode == "fused" or (STREAMING_EVALUATION and mode == "per_answer")
+    evaluation_slots = asyncio.Semaphore(EVALUATION_CONCURRENCY)
+
+    async def resume_or_transcribe(item):
+        question_id = item.get("question")
+        if question_id in checkpoints:
+            print(f"[transcribe] {question_id}: reusing checkpointed transcript")
+            return checkpoints[question_id]
+        assessment = None
+        if mode == "fused":
+            question_data, related_skill = map_answer_to_question(question_id, context["activeQuestions"])
+            assessment = {"question": question_data, "relatedSkill": related_skill, "course": context["course"]}
+        entry, status = await _transcribe_one(item, stages, (local_videos or {}).get(question_id), assessment, force)
+        transcript_store.save_checkpoint(student_id, course_id, entry, status)
+        return entry
+
+    async def transcribe_and_evaluate(item):
+        entry = await resume_or_transcribe(item)
+        if streaming and "analysis" not in entry:
+            await evaluate_one_video_answer(entry, context["activeQuestions"], context["course"], evaluation_slots)
+        return entry
+
+    started_at = datetime.utcnow()
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *[transcribe_and_evaluate(item) for item in video_urls],
+        return_exceptions=True
+    )
+
+    for result in results:
+        # CircuitOpenError included: the job queue retries once Gemini recovers
+        if isinstance(result, BaseException):
+            raise result
+    discard_local_videos(local_videos)
+    transcripts = list(results)
+    duration = time.monotonic() - started
+    print(f"Transcribed {len(transcripts)} videos{' and evaluated them' if streaming else ''} in {duration:.1f}s")
 
     # Step 5: Store transcript in DB
     try:
@@ -134,16 +429,29 @@ def transcribe_videos(student_id: str, course_id: str, video_urls: list):
             },
             {
                 "$set": {
-                    "videoAnswers": transcripts
+                    "videoAnswers": transcripts,
+                    # Same record shape as the analysis stages (see stage_graph)
+                    "pipeline.stages.transcribe": {
+                        "status": stage_graph.DONE,
+                        "startedAt": started_at,
+                        "durationMs": round(duration * 1000),
+                        "evaluatedWhileTranscribing": streaming
+                    }
                 }
             },
             upsert=True
         )
         print(f"Gemini transcription completed for student {student_id}")
-        
+
         # Trigger analysis
-        from app.routes.student import process_video_test_analysis
-        process_video_test_analysis(student_id, course_id)
-        
+        if context is None:
+            await process_video_test_analysis(student_id, course_id)
+        else:
+            context["response"]["videoAnswers"] = transcripts
+            await process_video_test_analysis(
+                student_id, course_id, context, evaluated_answers=transcripts if streaming else None
+            )
+
     except Exception as db_err:
         print(f"Failed to update DB or trigger analysis: {str(db_err)}")
+        raise
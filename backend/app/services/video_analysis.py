@@ -0,0 +1,352 @@
+import os
+import re
+import copy
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+from app.database.connection import (
+    db, students_collection, courses_collection, video_questions_collection, responses_collection,
+    admissions_status_collection, settings_collection, ai_evaluations_collection
+)
+from app.services.ai_service import (
+    evaluate_video_answer_async, evaluate_video_answers_batch_async, failed_video_evaluation, silent_video_evaluation,
+    write_skill_gap_reasoning_async, generate_overall_video_evaluation_async
+)
+from app.services.skill_gap_engine import discover_skill_gaps
+from app.services.stage_graph import Stage, StageGraph
+from app.services.ai_circuit_breaker import CircuitOpenError
+from app.services.transcription_service import EMPTY_TRANSCRIPT
+
+# Max concurrent evaluate_video_answer calls per submission
+EVALUATION_CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", 6))
+
+
+def map_answer_to_question(question_id, active_questions):
+    """
+    Resolves an answer's questionId (e.g. "Q1", "Video_1", "question_1") to the
+    question data used for evaluation. Returns (question_data, related_skill).
+    """
+    try:
+        # Find the numeric index from IDs like "Q1", "Video_1", "question_1"
+        match = re.search(r'\d+', question_id)
+        idx = int(match.group()) - 1 if match else -1
+        
+        if 0 <= idx < len(active_questions):
+            question_obj = active_questions[idx]
+            question_data = {
+                "question": question_obj.get("question"), 
+                "relatedSkill": question_obj.get("relatedSkill", "General"),
+                "expectedConcepts": question_obj.get("expectedConcepts", [])
+            }
+            return question_data, question_obj.get("relatedSkill", "General")
+    except Exception as e:
+        print(f"Index mapping error for {question_id}: {e}")
+    return {"question": question_id, "relatedSkill": "General"}, "General"
+
+
+def resolve_evaluation_mode(course, settings):
+    """
+    A course-level evaluationMode wins over the global system setting.
+    """
+    mode = course.get("evaluationMode") or (settings.get("evaluationMode") if settings else None)
+    return mode if mode in ("per_answer", "batched", "fused") else "per_answer"
+
+
+def is_silent_answer(q_answer):
+    return q_answer.get("silent") or (q_answer.get("transcript") or "").strip() == EMPTY_TRANSCRIPT
+
+
+async def evaluate_one_video_answer(q_answer, active_questions, course, semaphore):
+    """
+    Attaches "relatedSkill" and "analysis" to one answer. A failure only
+    affects this answer; CircuitOpenError is raised.
+    """
+    question_data, related_skill = map_answer_to_question(q_answer.get("questionId"), active_questions)
+    q_answer["relatedSkill"] = related_skill
+    if is_silent_answer(q_answer):
+        q_answer["analysis"] = silent_video_evaluation(related_skill)
+        return q_answer
+    try:
+        async with semaphore:
+            q_answer["analysis"] = await evaluate_video_answer_async(question_data, q_answer.get("transcript"), course)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        print(f"Evaluation failed for {q_answer.get('questionId')}: {e}")
+        q_answer["analysis"] = failed_video_evaluation(related_skill)
+    return q_answer
+
+
+async def evaluate_video_answers(video_answers, active_questions, course, mode="per_answer"):
+    """
+    Evaluates every answer and returns them in their original order with
+    "analysis" attached.
+
+    In "batched" mode all answers go to Gemini in one structured request; if
+    that fails or does not validate, answers are evaluated individually.
+    "fused" answers are normally evaluated during transcription; here (e.g. a
+    re-analysis) they are evaluated individually from their transcripts.
+    Per-answer calls run concurrently (bounded by EVALUATION_CONCURRENCY) and a
+    failure on one answer only affects that answer. CircuitOpenError is raised
+    so the whole analysis can be deferred instead of storing failed evaluations.
+    Answers with no detectable speech get a canonical zero-score analysis
+    without a Gemini call.
+    """
+    semaphore = asyncio.Semaphore(EVALUATION_CONCURRENCY)
+    spoken = [q_answer for q_answer in video_answers if not is_silent_answer(q_answer)]
+    if mode == "batched" and spoken:
+        mapped = [map_answer_to_question(q_answer.get("questionId"), active_questions) for q_answer in spoken]
+        try:
+            analyses = await evaluate_video_answers_batch_async(
+                [(question_data, q_answer.get("transcript")) for (question_data, _), q_answer in zip(mapped, spoken)],
+                course
+            )
+            for q_answer, (_, related_skill), analysis in zip(spoken, mapped, analyses):
+                q_answer["relatedSkill"] = related_skill
+                q_answer["analysis"] = analysis
+            # Only silent answers are left; they never reach Gemini
+            for q_answer in video_answers:
+                if is_silent_answer(q_answer):
+                    await evaluate_one_video_answer(q_answer, active_questions, course, semaphore)
+            return video_answers
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"Batched evaluation failed, falling back to per-answer calls: {e}")
+
+    return await asyncio.gather(*[
+        evaluate_one_video_answer(q_answer, active_questions, course, semaphore) for q_answer in video_answers
+    ])
+
+
+def load_analysis_context(student_id: str, course_id: str):
+    """
+    Reads everything video analysis needs besides the answers: the latest
+    response, the course, the questions that were asked and the global
+    settings. Returns None if the response or course is missing.
+    """
+    # 1. Fetch the latest student response
+    response = responses_collection.find_one({
+        "studentId": ObjectId(student_id),
+        "courseId": ObjectId(course_id)
+    }, sort=[("submittedAt", -1)])
+    if not response:
+        return None
+
+    # 2. Identify which questions were used
+    course = courses_collection.find_one({"_id": ObjectId(course_id)})
+    if not course:
+        print("Course not found")
+        return None
+
+    # Check if it was a retest with dynamic questions
+    admission = admissions_status_collection.find_one({"responseId": response["_id"]})
+    if admission and "retestQuestions" in admission:
+        active_questions = admission["retestQuestions"]
+        print(f"Using dynamic retest questions for student {student_id}")
+    else:
+        video_questions_doc = video_questions_collection.find_one({"courseId": ObjectId(course_id)})
+        active_questions = video_questions_doc.get("videoQuestions", []) if video_questions_doc else []
+        print(f"Using standard course questions for student {student_id}")
+
+    # Fetch settings for weightages, passing score and evaluation mode
+    settings = settings_collection.find_one({"type": "global_config"})
+    return {
+        "response": response,
+        "course": course,
+        "activeQuestions": active_questions,
+        "settings": settings,
+        "evaluationMode": resolve_evaluation_mode(course, settings)
+    }
+
+
+async def _evaluate_answers_stage(outputs):
+    # 3. Analyze each answer
+    context = outputs["context"]
+    return await evaluate_video_answers(
+        context["response"].get("videoAnswers", []), context["activeQuestions"],
+        context["course"], context["evaluationMode"]
+    )
+
+
+async def _skill_gaps_stage(outputs):
+    context = outputs["context"]
+    settings = context["settings"]
+    skill_threshold = settings.get("passingScore", 70) / 10 if settings else 7.0
+    return discover_skill_gaps(
+        context["response"].get("mcqAnswers", []), outputs["evaluate_answers"], context["course"], threshold=skill_threshold,
+        mcq_weight=settings.get("mcqWeightage", 40) if settings else 40,
+        video_weight=settings.get("videoWeightage", 60) if settings else 60
+    )
+
+
+async def _skill_gap_reasoning_stage(outputs):
+    # Scores are computed locally; Gemini only (optionally) rewrites the reasoning
+    settings = outputs["context"]["settings"]
+    detailed_skill_gaps = copy.deepcopy(outputs["skill_gaps"])
+    if settings and settings.get("aiSkillGapReasoning") and detailed_skill_gaps:
+        gap_skills = [skill for cat in detailed_skill_gaps for skill in cat["skills"] if skill["isGap"]]
+        reasoning = await write_skill_gap_reasoning_async(gap_skills, outputs["evaluate_answers"], outputs["context"]["course"])
+        for skill in gap_skills:
+            if isinstance(reasoning.get(skill["skillName"]), str):
+                skill["reasoning"] = reasoning[skill["skillName"]]
+    return detailed_skill_gaps
+
+
+async def _overall_verdict_stage(outputs):
+    # 4.1 Overall Performance Signal (AI-based)
+    return await generate_overall_video_evaluation_async(outputs["evaluate_answers"], outputs["context"]["course"])
+
+
+async def _save_evaluation_stage(outputs):
+    updated_answers = outputs["evaluate_answers"]
+    detailed_skill_gaps = outputs["skill_gap_reasoning"]
+    overall_eval = outputs["overall_verdict"]
+    response = outputs["context"]["response"]
+
+    # Answers whose evaluation failed carry placeholder zeros; keep them out of the average
+    failed_evaluations = [answer.get("questionId") for answer in updated_answers if answer["analysis"].get("evaluationFailed")]
+    scored_answers = [answer for answer in updated_answers if not answer["analysis"].get("evaluationFailed")]
+    total_score = sum(answer["analysis"].get("technicalScore", 0) for answer in scored_answers)
+    count = len(scored_answers)
+    avg_score = round(total_score / count, 2) if count > 0 else 0
+
+    # Flatten the detailed categorical gaps
+    unique_weak_skills = []
+    for cat in detailed_skill_gaps:
+        for skill in cat.get("skills", []):
+            if skill.get("isGap", False):
+                unique_weak_skills.append(skill.get("skillName"))
+    unique_weak_skills = list(set([s for s in unique_weak_skills if s != "General"]))
+
+    # 5. Update DB (Normalized)
+    response_id = response["_id"]
+
+    ai_eval_data = {
+        "responseId": response_id,
+        "studentId": ObjectId(outputs["studentId"]),
+        "courseId": ObjectId(outputs["courseId"]),
+        "scores": {
+            "mcq": response.get("mcqScore", 0),
+            "overallVideo": avg_score
+        },
+        "executiveSummary": overall_eval.get("executiveSummary"),
+        "skillGaps": unique_weak_skills,
+        "vibeCheck": overall_eval.get("vibeCheck"),
+        "aiVerdict": overall_eval.get("aiVerdict"),
+        "eligibilitySignal": overall_eval.get("overallEligibilitySignal"),
+        "overallReasoning": overall_eval.get("overallReasoning"),
+        "competencyGapReport": overall_eval.get("competencyGap"),
+        "detailedSkillGap": detailed_skill_gaps,
+        "failedEvaluations": failed_evaluations,
+        "evaluatedAt": datetime.utcnow()
+    }
+
+    ai_evaluations_collection.update_one(
+        {"responseId": response_id},
+        {"$set": ai_eval_data},
+        upsert=True
+    )
+
+    responses_collection.update_one(
+        {"_id": response_id},
+        {"$set": {"videoAnswers": updated_answers}}
+    )
+    return {"overallVideo": avg_score, "skillGaps": unique_weak_skills}
+
+
+async def _notify_admin_stage(outputs):
+    # 6. Notify Admin
+    saved = outputs["save_evaluation"]
+    notify_admin_of_evaluation(outputs["studentId"], outputs["courseId"], saved["overallVideo"], saved["skillGaps"])
+
+
+# Skill gaps and the overall verdict only need the evaluated answers, so they run side by side
+VIDEO_ANALYSIS_GRAPH = StageGraph([
+    Stage("evaluate_answers", _evaluate_answers_stage),
+    Stage("skill_gaps", _skill_gaps_stage, after=["evaluate_answers"]),
+    Stage("skill_gap_reasoning", _skill_gap_reasoning_stage, after=["skill_gaps"]),
+    Stage("overall_verdict", _overall_verdict_stage, after=["evaluate_answers"]),
+    Stage("save_evaluation", _save_evaluation_stage, after=["skill_gap_reasoning", "overall_verdict"]),
+    Stage("notify_admin", _notify_admin_stage, after=["save_evaluation"], persist=False)
+])
+
+
+def record_pipeline_stage(response_id, name, record):
+    """
+    Stores a stage record (status, timing, output) under pipeline.stages.<name>
+    on the response.
+    """
+    responses_collection.update_one(
+        {"_id": response_id},
+        {"$set": {f"pipeline.stages.{name}": record}}
+    )
+
+
+async def process_video_test_analysis(student_id: str, course_id: str, context: dict = None,
+                                      evaluated_answers: list = None, from_stage: str = None):
+    """
+    Runs VIDEO_ANALYSIS_GRAPH: answer evaluation, then skill gaps and the
+    overall verdict, then the stored evaluation and admin notification. Each
+    stage's status, timing and output are stored on the response under
+    pipeline.stages. The transcription job passes the `context` it already
+    loaded and, if it evaluated answers while transcribing,
+    `evaluated_answers`, so nothing is read from the database again.
+    `from_stage` reruns that stage and everything after it, reusing the saved
+    output of earlier stages.
+
+    Failures are re-raised (after their stage record is stored) so the job
+    queue can retry or dead-letter the analysis.
+    """
+    try:
+        context = context or load_analysis_context(student_id, course_id)
+        video_answers = context and (evaluated_answers if evaluated_answers is not None else context["response"].get("videoAnswers"))
+        if not video_answers:
+            print("No video answers found for analysis")
+            return
+
+        response_id = context["response"]["_id"]
+        await VIDEO_ANALYSIS_GRAPH.run(
+            {"studentId": student_id, "courseId": course_id, "context": context},
+            saved=context["response"].get("pipeline", {}).get("stages"),
+            from_stage=from_stage,
+            provided={"evaluate_answers": evaluated_answers} if evaluated_answers is not None else None,
+            on_record=lambda name, record: record_pipeline_stage(response_id, name, record)
+        )
+
+        print(f"AI analysis completed for student {student_id} in course {course_id}")
+
+    except CircuitOpenError:
+        # Gemini is failing and nothing has been written yet; the job queue retries later
+        raise
+    except Exception as e:
+        print(f"Error in process_video_test_analysis: {str(e)}")
+        raise
+
+
+def notify_admin_of_evaluation(student_id, course_id, score, skill_gap):
+    try:
+        student = students_collection.find_one({"_id": ObjectId(student_id)})
+        course = courses_collection.find_one({"_id": ObjectId(course_id)})
+        
+        if not student or not course:
+            return
+
+        notification = {
+            "type": "video_test_evaluation",
+            "studentId": ObjectId(student_id),
+            "studentName": f"{student.get('firstName')} {student.get('lastName')}",
+            "courseId": ObjectId(course_id),
+            "courseTitle": course.get('title'),
+            "score": round(score, 2),
+            "skillGap": skill_gap,
+            "status": "unread",
+            "isRead": False,
+            "timestamp": datetime.utcnow()
+        }
+        
+        # Insert into a notifications collection in the main db
+        db.notifications.insert_one(notification)
+        print("Admin notification created")
+    except Exception as e:
+        print(f"Failed to notify admin: {str(e)}")
@@ -0,0 +1,126 @@
+"""
+Offline stand-in for the Cloudinary video upload API, so direct-to-storage
+submissions can be tried without Cloudinary:
+
+    python local_storage_server.py --port 9000
+    CLOUDINARY_UPLOAD_URL=http://localhost:9000/v1_1/local/video/upload \
+    CLOUDINARY_DELIVERY_URL=http://localhost:9000/files uvicorn app.main:app
+
+It checks upload signatures with CLOUDINARY_API_SECRET, stores files under
+LOCAL_STORAGE_DIR, serves them back (so transcription can download them) and
+posts signed upload notifications to `notification_url` like Cloudinary does.
+"""
+import os
+import re
+import json
+import time
+import argparse
+import requests
+import uvicorn
+import cloudinary.utils
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse
+
+load_dotenv()
+
+API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+LOCAL_STORAGE_DIR = os.path.abspath(os.getenv("LOCAL_STORAGE_DIR", "local_storage"))
+SIGNED_UPLOAD_TTL_S = int(os.getenv("SIGNED_UPLOAD_TTL_S", 3600))
+# Not part of the signature (same as Cloudinary)
+UNSIGNED_FIELDS = {"file", "api_key", "signature", "resource_type", "cloud_name"}
+
+app = FastAPI(title="Local storage stand-in")
+
+
+def _notify(notification_url, result):
+    body = json.dumps({**result, "notification_type": "upload"})
+    timestamp = str(int(time.time()))
+    try:
+        requests.post(notification_url, data=body, timeout=10, headers={
+            "Content-Type": "application/json",
+            "X-Cld-Timestamp": timestamp,
+            "X-Cld-Signature": cloudinary.utils.compute_hex_hash(body + timestamp + API_SECRET)
+        })
+    except requests.exceptions.RequestException as e:
+        print(f"Warning: Upload notification to {notification_url} failed: {e}")
+
+
+@app.post("/v1_1/{cloud_name}/video/upload")
+async def upload(cloud_name: str, request: Request, background_tasks: BackgroundTasks):
+    form = await request.form()
+    upload_file = form.get("file")
+    params = {key: value for key, value in form.items() if key not in UNSIGNED_FIELDS}
+    if upload_file is None or "public_id" not in params:
+        raise HTTPException(status_code=400, detail="file and public_id are required")
+    if form.get("signature") != cloudinary.utils.api_sign_request(params, API_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    if int(params.get("timestamp", 0)) < time.time() - SIGNED_UPLOAD_TTL_S:
+        raise HTTPException(status_code=401, detail="Signature expired")
+
+    public_id = f"{params['folder']}/{params['public_id']}" if params.get("folder") else params["public_id"]
+    extension = os.path.splitext(upload_file.filename or "")[1] or ".mp4"
+    path = os.path.join(LOCAL_STORAGE_DIR, public_id + extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Chunked uploads (upload_large) send one part per request with a Content-Range header
+    content_range = request.headers.get("Content-Range")
+    start, end, total = 0, None, None
+    if content_range:
+        span, total = content_range.removeprefix("bytes ").split("/")
+        start, end = (int(value) for value in span.split("-"))
+        total = int(total)
+    with open(path, "r+b" if start and os.path.exists(path) else "wb") as stored:
+        stored.seek(start)
+        while chunk := await upload_file.read(1024 * 1024):
+            stored.write(chunk)
+    if total is not None and end + 1 < total:
+        return {"done": False, "public_id": public_id}
+
+    version = int(time.time())
+    url = f"{str(request.base_url).rstrip('/')}/files/v{version}/{public_id}{extension}"
+    result = {
+        "public_id": public_id,
+        "version": version,
+        "signature": cloudinary.utils.api_sign_request({"public_id": public_id, "version": version}, API_SECRET, signature_version=1),
+        "resource_type": "video",
+        "format": extension.lstrip("."),
+        "bytes": os.path.getsize(path),
+        "url": url,
+        "secure_url": url
+    }
+    if params.get("notification_url"):
+        background_tasks.add_task(_notify, params["notification_url"], result)
+    print(f"Stored {public_id} ({result['bytes']} bytes)")
+    return result
+
+
+@app.get("/files/{path:path}")
+async def serve(path: str):
+    # Only the latest upload is kept, so the version segment is not needed to find it
+    path = re.sub(r"^v\d+/", "", path)
+    full_path = os.path.abspath(os.path.join(LOCAL_STORAGE_DIR, path))
+    if not full_path.startswith(LOCAL_STORAGE_DIR + os.sep):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not os.path.isfile(full_path):
+        # Delivery URLs may leave out the extension, as Cloudinary's do
+        directory, name = os.path.split(full_path)
+        matches = [entry for entry in os.listdir(directory) if os.path.splitext(entry)[0] == name] if os.path.isdir(directory) else []
+        if not matches:
+            raise HTTPException(status_code=404, detail="Not found")
+        full_path = os.path.join(directory, matches[0])
+    return FileResponse(full_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a local stand-in for Cloudinary video uploads.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    if not API_SECRET:
+        raise SystemExit("CLOUDINARY_API_SECRET must be set (the API signs uploads with it)")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 import sys
 import json
+import asyncio
 from bson import ObjectId
 from dotenv import load_dotenv
 
@@ -8,11 +9,15 @@ from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
 from app.database.connection import responses_collection, courses_collection
-from app.routes.student import process_video_test_analysis
+from app.services.video_analysis import process_video_test_analysis, VIDEO_ANALYSIS_GRAPH
+from app.services.transcription_service import transcribe_videos
+
+# "transcribe" re-runs transcription (reusing checkpoints) and then the whole analysis
+STAGES = ["transcribe", *VIDEO_ANALYSIS_GRAPH.order]
 
 load_dotenv()
 
-def run_manual_evaluation(response_id_str):
+def run_manual_evaluation(response_id_str, from_stage=None):
     print(f"--- Triggering Manual AI Evaluation for Response ID: {response_id_str} ---")
     
     try:
@@ -47,11 +52,19 @@ def run_manual_evaluation(response_id_str):
         print("If you need to RE-TRANSCRIBE from original videos, please use the transcription service first.")
         print("Currently, we will try to analyze existing answers.")
 
+    # Show how the previous run went, stage by stage
+    for name, record in response.get("pipeline", {}).get("stages", {}).items():
+        print(f"  [{record.get('status')}] {name}: {record.get('durationMs', '-')} ms")
+
     # 3. Call the official application logic
-    print("\n[Action] Running process_video_test_analysis...")
     try:
-        # This function updates the database, calculates scores, and creates notifications
-        process_video_test_analysis(student_id, course_id)
+        if from_stage == "transcribe":
+            print("\n[Action] Running transcribe_videos...")
+            asyncio.run(transcribe_videos(student_id, course_id, response.get("videoUrls", [])))
+        else:
+            print(f"\n[Action] Running process_video_test_analysis{f' from stage {from_stage}' if from_stage else ''}...")
+            # This function updates the database, calculates scores, and creates notifications
+            asyncio.run(process_video_test_analysis(student_id, course_id, from_stage=from_stage))
         print("\n✅ Success: AI Evaluation completed and Database updated!")
         print("You can now refresh the Admin Dashboard to see the 'Golden Report' and updated scores.")
     except Exception as e:
@@ -60,9 +73,20 @@ def run_manual_evaluation(response_id_str):
     print("\n--- Process Complete ---")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python run_ai_analysis.py <response_id>")
+    args = sys.argv[1:]
+    from_stage = None
+    if "--from-stage" in args:
+        index = args.index("--from-stage")
+        from_stage = args[index + 1] if index + 1 < len(args) else None
+        del args[index:index + 2]
+        if from_stage not in STAGES:
+            print(f"--from-stage must be one of: {', '.join(STAGES)}")
+            sys.exit(1)
+
+    if len(args) < 1:
+        print("Usage: python run_ai_analysis.py <response_id> [--from-stage <stage>]")
+        print(f"  --from-stage  rerun that stage and everything after it ({', '.join(STAGES)})")
         sys.exit(1)
         
-    res_id = sys.argv[1]
-    run_manual_evaluation(res_id)
+    res_id = args[0]
+    run_manual_evaluation(res_id, from_stage)
@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 from bson import ObjectId
 from datetime import datetime
 
@@ -8,6 +9,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from app.services.transcription_service import transcribe_videos
+    from app.services.transcript_store import clear_checkpoints
     from app.database.connection import responses_collection, ai_evaluations_collection, admissions_status_collection
     print("Successfully imported transcription_service and database connection")
 except ImportError as e:
@@ -15,12 +17,15 @@ except ImportError as e:
     sys.exit(1)
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python run_analysis.py <student_id> <course_id>")
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    force = "--force" in sys.argv[1:]
+    if len(args) < 2:
+        print("Usage: python run_analysis.py <student_id> <course_id> [--force]")
+        print("  --force  re-transcribe every video, ignoring checkpoints and the transcript cache")
         sys.exit(1)
 
-    student_id = sys.argv[1]
-    course_id = sys.argv[2]
+    student_id = args[0]
+    course_id = args[1]
 
     # Validate ObjectIds
     try:
@@ -82,6 +87,11 @@ def main():
             {"$unset": {"videoAnswers": ""}}
         )
         
+        # Keep per-question transcript checkpoints unless a full re-transcription is requested
+        if force:
+            cleared = clear_checkpoints(student_id, course_id)
+            print(f"Cleared {cleared} transcript checkpoints")
+
         print(f"DB reset complete for Response ID: {rid}")
 
     except Exception as e:
@@ -90,7 +100,7 @@ def main():
     # Step 3: Trigger full pipeline (Transcription -> Analysis)
     try:
         print("Starting Gemini Video Transcription process...")
-        transcribe_videos(student_id, course_id, video_urls_to_process)
+        asyncio.run(transcribe_videos(student_id, course_id, video_urls_to_process, force=force))
         print("\nPipeline finished.")
     except Exception as e:
         print(f"An error occurred during pipeline execution: {e}")
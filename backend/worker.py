@@ -0,0 +1,24 @@
+import sys
+import os
+import asyncio
+import argparse
+
+# Add the current directory to sys.path so 'app' can be imported
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.job_worker import run_worker, JOB_CONCURRENCY
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs queued transcription and video analysis jobs.")
+    parser.add_argument("--concurrency", type=int, default=JOB_CONCURRENCY, help="Jobs to run at the same time")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_worker(concurrency=args.concurrency))
+    except KeyboardInterrupt:
+        print("\nWorker stopped.")
+
+
+if __name__ == "__main__":
+    main()
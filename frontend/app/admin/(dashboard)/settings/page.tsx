@@ -20,6 +20,8 @@ export default function SettingsPage() {
         mcqWeightage: 40,
         videoWeightage: 60,
         passingScore: 50,
+        evaluationMode: "per_answer",
+        aiSkillGapReasoning: false,
         instituteName: "",
         instituteAddress: "",
         instituteWebsite: "",
@@ -182,6 +184,29 @@ export default function SettingsPage() {
                             onChange={(e) => setSettings({ ...settings, passingScore: parseInt(e.target.value) })}
                         />
                     </div>
+                    <div className={styles.formGroup}>
+                        <label className={styles.label}>Video Evaluation Mode</label>
+                        <select
+                            className={styles.input}
+                            value={settings.evaluationMode}
+                            onChange={(e) => setSettings({ ...settings, evaluationMode: e.target.value })}
+                        >
+                            <option value="per_answer">Per answer</option>
+                            <option value="batched">Batched (one call per submission)</option>
+                            <option value="fused">Fused with transcription</option>
+                        </select>
+                    </div>
+                    <div className={styles.formGroup}>
+                        <label className={styles.label}>AI-Written Skill Gap Reasoning</label>
+                        <select
+                            className={styles.input}
+                            value={settings.aiSkillGapReasoning ? "on" : "off"}
+                            onChange={(e) => setSettings({ ...settings, aiSkillGapReasoning: e.target.value === "on" })}
+                        >
+                            <option value="off">Off</option>
+                            <option value="on">On</option>
+                        </select>
+                    </div>
                 </div>
             </section>
             {/* 3. Institute Profile & Letterhead */}